@@ -1,15 +1,37 @@
-import re
+import os
+import sys
+import json
+import argparse
 import random
-from typing import List, Dict, Any
+import asyncio
+import datetime as dt
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Iterator, AsyncIterator
 from dotenv import load_dotenv
 
 from pydantic import BaseModel, Field
-from langchain_core.tools import tool
+from langchain_core.tools import StructuredTool
 from langchain_openai import ChatOpenAI
 from langchain.agents import create_agent
-from langgraph.checkpoint.memory import MemorySaver
 
-from tools import places_text_search, get_weather, get_air_quality
+from tools import (
+    places_text_search,
+    get_weather,
+    get_air_quality,
+    get_daily_forecast,
+    aget_daily_forecast,
+)
+import metrics
+from render import render_plan, render_day
+from air_slots import slot_air, day_mask
+from compact import compact_plan, compaction_stats
+from catalog import catalog_places
+from cache import attractions_cache, normalize_key, plan_store, plan_cache, plan_cache_key
+from checkpoint_store import make_checkpointer
+from history import PlanHistoryMiddleware
+from itinerary import parse_itinerary, ItinerarySyntaxError
+from usage import ModelUsageCallback, run_usage, add_thread_usage
 
 load_dotenv(override=True)
 
@@ -40,26 +62,163 @@ class AttractionList(BaseModel):
     )
 
 
-@tool
-def generate_attractions(city: str) -> dict:
+ATTRACTIONS_PROMPT = (
+    "Give 4 to 6 popular tourist attractions in {city}. "
+    "Return names only. No addresses. No extra text."
+)
+
+
+@lru_cache(maxsize=1)
+def _attraction_generator():
+    """
+    Built once and reused: the model client and its structured-output wrapper.
+    """
+    generator_llm = ChatOpenAI(
+        model="gpt-4o-mini", temperature=0, callbacks=[ModelUsageCallback("attractions")]
+    )
+    return generator_llm.with_structured_output(AttractionList)
+
+
+@metrics.instrument("generate_attractions")
+def _generate_attractions(city: str) -> dict:
     """
     Generate attraction NAMES for a city using structured output.
     Returns {"places": [...]}.
     """
-    generator_llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
-    structured = generator_llm.with_structured_output(AttractionList)
+    cache_key = normalize_key(city)
+    hit, cached = attractions_cache.get(cache_key)
+    if hit:
+        return cached
 
-    result: AttractionList = structured.invoke(
-        f"Give 4 to 6 popular tourist attractions in {city}. "
-        f"Return names only. No addresses. No extra text."
+    result: AttractionList = _attraction_generator().invoke(ATTRACTIONS_PROMPT.format(city=city))
+    return _remember_attractions(cache_key, result.places)
+
+
+@metrics.instrument("generate_attractions")
+async def _agenerate_attractions(city: str) -> dict:
+    cache_key = normalize_key(city)
+    hit, cached = await attractions_cache.aget(cache_key)
+    if hit:
+        return cached
+
+    result: AttractionList = await _attraction_generator().ainvoke(
+        ATTRACTIONS_PROMPT.format(city=city)
     )
-    return {"places": result.places}
+    return await asyncio.to_thread(_remember_attractions, cache_key, result.places)
+
+
+def _remember_attractions(cache_key: str, places: List[str]) -> dict:
+    gen = {"places": places}
+    if places:
+        attractions_cache.set(cache_key, gen)
+    return gen
+
+
+generate_attractions = StructuredTool.from_function(
+    func=_generate_attractions,
+    coroutine=_agenerate_attractions,
+    name="generate_attractions",
+)
+
+
+class CityAttractions(BaseModel):
+    city: str = Field(description="The city name exactly as given.")
+    places: List[str] = Field(
+        description="4 to 6 popular tourist attractions (names only)."
+    )
+
+
+class AttractionBatch(BaseModel):
+    cities: List[CityAttractions] = Field(description="One entry per requested city.")
+
+
+BATCH_ATTRACTIONS_PROMPT = (
+    "For each of these cities, give 4 to 6 popular tourist attractions: {cities}. "
+    "Return one entry per city with the city name exactly as given. "
+    "Names only. No addresses. No extra text."
+)
+
+
+@lru_cache(maxsize=1)
+def _batch_attraction_generator():
+    generator_llm = ChatOpenAI(
+        model="gpt-4o-mini", temperature=0, callbacks=[ModelUsageCallback("attractions_batch")]
+    )
+    return generator_llm.with_structured_output(AttractionBatch)
+
+
+def _cities_to_generate(days: List[Dict[str, Any]]) -> Dict[str, str]:
+    """
+    {normalized city: city} for slot-less days that are neither in the
+    catalog nor already in the attractions cache.
+    """
+    cities: Dict[str, str] = {}
+    for day in days:
+        if day.get("slots"):
+            continue
+        key = normalize_key(day["city"])
+        if key in cities or catalog_places(day["city"]) is not None:
+            continue
+        if attractions_cache.get(key)[0]:
+            continue
+        cities[key] = day["city"]
+    return cities
+
+
+def _remember_batch(cities: Dict[str, str], batch: AttractionBatch) -> None:
+    for entry in batch.cities:
+        key = normalize_key(entry.city)
+        if key in cities:
+            _remember_attractions(key, entry.places)
+
+
+@metrics.instrument("generate_attractions_batch")
+def _generate_attractions_batch(cities: Dict[str, str]) -> dict:
+    try:
+        batch = _batch_attraction_generator().invoke(
+            BATCH_ATTRACTIONS_PROMPT.format(cities="; ".join(cities.values()))
+        )
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}"}
+    _remember_batch(cities, batch)
+    return {"cities": len(batch.cities)}
+
+
+@metrics.instrument("generate_attractions_batch")
+async def _agenerate_attractions_batch(cities: Dict[str, str]) -> dict:
+    try:
+        batch = await _batch_attraction_generator().ainvoke(
+            BATCH_ATTRACTIONS_PROMPT.format(cities="; ".join(cities.values()))
+        )
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}"}
+    await asyncio.to_thread(_remember_batch, cities, batch)
+    return {"cities": len(batch.cities)}
+
+
+def prefetch_attractions(days: List[Dict[str, Any]]) -> None:
+    """
+    When two or more slot-less cities need LLM attractions, ask for all of them
+    in one structured call and put each city's names in the attractions cache.
+    fill_generated_slots then reads the cache; a city missing from the answer
+    (or a failed batch) falls back to its own generate_attractions call.
+    """
+    cities = _cities_to_generate(days)
+    if len(cities) > 1:
+        _generate_attractions_batch(cities)
+
+
+async def aprefetch_attractions(days: List[Dict[str, Any]]) -> None:
+    # Cache lookups hit SQLite: off the event loop
+    cities = await asyncio.to_thread(_cities_to_generate, days)
+    if len(cities) > 1:
+        await _agenerate_attractions_batch(cities)
 
 
 # -------------------------
 # 1) Parse hard-mode input
 # -------------------------
-def parse_hard_input(text: str) -> List[Dict[str, Any]]:
+def parse_hard_input(text: str, errors: Optional[List[ItinerarySyntaxError]] = None) -> List[Dict[str, Any]]:
     """
     Example:
     City1: Toronto 2026-01-31 CN Tower;8am-9am Royal Ontario Museum;10am-11am
@@ -68,178 +227,872 @@ def parse_hard_input(text: str) -> List[Dict[str, Any]]:
     Also supports:
     City1: Toronto 2026-01-31
     (then we auto-generate attractions)
+
+    Parsed in one pass by itinerary.py. Malformed days/slots are skipped; pass a
+    list as `errors` to get each problem with its line/column.
     """
-    blocks = re.split(r"City\d+\s*:\s*", text.strip())
-    blocks = [b.strip() for b in blocks if b.strip()]
+    return parse_itinerary(text, [] if errors is None else errors)
+
+
+def parse_reporting_errors(text: str) -> List[Dict[str, Any]]:
+    """
+    parse_hard_input for the CLI / agent: each skipped problem is printed to
+    stderr with its line and column, and the rest of the itinerary is planned.
+    """
+    errors: List[ItinerarySyntaxError] = []
+    trip = parse_hard_input(text, errors)
+    for e in errors:
+        print(f"itinerary: {e}", file=sys.stderr)
+    return trip
+
+
+# -------------------------
+# 2) Build plan (tool calls)
+# -------------------------
+POSSIBLE_TIMES = [
+    "9:00 AM – 10:30 AM",
+    "10:30 AM – 12:00 PM",
+    "1:00 PM – 2:30 PM",
+    "3:00 PM – 4:30 PM",
+    "5:00 PM – 6:30 PM",
+    "7:00 PM – 8:30 PM",
+]
+
+# Upper bound on in-flight tool calls when build_plan runs concurrently
+MAX_WORKERS = int(os.getenv("PLAN_MAX_WORKERS", "8"))
+
+
+def fill_generated_slots(day: Dict[str, Any]) -> None:
+    """
+    HARD MODE:
+    If no slots were provided, generate attraction names + random time slots.
+    Cities in the offline catalog (catalog.py) come pre-geocoded: no LLM or Places call.
+    """
+    if day.get("slots"):
+        return
+
+    places = catalog_places(day["city"])
+    if places is None:
+        places = generate_attractions.invoke({"city": day["city"]}).get("places", [])
+    assign_generated_slots(day, places)
+
 
-    trip: List[Dict[str, Any]] = []
+async def afill_generated_slots(day: Dict[str, Any]) -> None:
+    if day.get("slots"):
+        return
 
-    for b in blocks:
-        parts = b.split()
-        if len(parts) < 2:
+    places = catalog_places(day["city"])
+    if places is None:
+        places = (await generate_attractions.ainvoke({"city": day["city"]})).get("places", [])
+    assign_generated_slots(day, places)
+
+
+def assign_generated_slots(day: Dict[str, Any], places: List[Any]) -> None:
+    """
+    places: attraction names, or catalog entries {"name", "address", "lat", "lon"}.
+    """
+    # Stable randomness per city (so your demo doesn't change every run)
+    rng = random.Random(day["city"])
+
+    used_times = set()
+    day["slots"] = []
+    day["generated"] = True
+
+    for place in places:
+        available = [t for t in POSSIBLE_TIMES if t not in used_times]
+        if not available:
+            available = POSSIBLE_TIMES
+
+        time_slot = rng.choice(available)
+        used_times.add(time_slot)
+
+        entry = place if isinstance(place, dict) else {"name": place}
+        day["slots"].append({**entry, "time": time_slot})
+
+
+def resolve_slot(slot: Dict[str, Any], city: str) -> Dict[str, Any]:
+    """
+    Resolve one slot name -> address, lat, lon (keeps the error if Places fails).
+    """
+    if slot.get("lat") is not None:
+        # Pre-geocoded catalog slot
+        return slot_from_place(slot, slot)
+    place = places_text_search.invoke({"place_name": slot["name"], "city": city})
+    return slot_from_place(slot, place)
+
+
+async def aresolve_slot(slot: Dict[str, Any], city: str) -> Dict[str, Any]:
+    if slot.get("lat") is not None:
+        return slot_from_place(slot, slot)
+    place = await places_text_search.ainvoke({"place_name": slot["name"], "city": city})
+    return slot_from_place(slot, place)
+
+
+def slot_from_place(slot: Dict[str, Any], place: Dict[str, Any]) -> Dict[str, Any]:
+    if place.get("error"):
+        return {"time": slot.get("time", ""), "name": slot["name"], "error": place.get("error")}
+
+    return {
+        "time": slot.get("time", ""),
+        "name": place.get("name") or slot["name"],
+        "address": place.get("address"),
+        "lat": place.get("lat"),
+        "lon": place.get("lon"),
+    }
+
+
+def first_location(resolved_slots: List[Dict[str, Any]]):
+    """
+    Coordinates of the first successfully resolved slot, or (None, None).
+    """
+    for s in resolved_slots:
+        if not s.get("error"):
+            return s.get("lat"), s.get("lon")
+    return None, None
+
+
+# The whole Air Quality forecast window, so any slot in the next 4 days has its own hours
+AIR_FORECAST_HOURS = 96
+
+
+def lookup_air(lat, lon):
+    """
+    Hourly air quality for one location (None when the day has no resolved place).
+    """
+    if lat is None or lon is None:
+        return None
+    return get_air_quality.invoke({"lat": lat, "lon": lon, "hours": AIR_FORECAST_HOURS})
+
+
+async def alookup_air(lat, lon):
+    if lat is None or lon is None:
+        return None
+    return await get_air_quality.ainvoke({"lat": lat, "lon": lon, "hours": AIR_FORECAST_HOURS})
+
+
+# Google Weather returns at most 10 forecast days, starting today
+WEATHER_MAX_DAYS = 10
+
+
+def group_city_forecasts(trip: List[Dict[str, Any]], resolved) -> List[Dict[str, Any]]:
+    """
+    One weather request per city: the first resolved location of the city and
+    enough forecast days to cover its latest itinerary date.
+    """
+    groups: Dict[str, Dict[str, Any]] = {}
+
+    for i, (day, slots) in enumerate(zip(trip, resolved)):
+        g = groups.setdefault(
+            day["city"].casefold(),
+            {"city": day["city"].casefold(), "lat": None, "lon": None, "dates": [], "day_indexes": []},
+        )
+        g["dates"].append(day["date"])
+        g["day_indexes"].append(i)
+        if g["lat"] is None:
+            g["lat"], g["lon"] = first_location(slots)
+
+    for g in groups.values():
+        g["days"] = forecast_span(g["dates"])
+
+    return list(groups.values())
+
+
+def forecast_span(dates: List[str]) -> int:
+    today = dt.date.today()
+    span = 1
+    for d in dates:
+        try:
+            span = max(span, (dt.date.fromisoformat(d) - today).days + 1)
+        except ValueError:
             continue
+    return min(span, WEATHER_MAX_DAYS)
 
-        city = parts[0]
-        date = parts[1]
-        rest = " ".join(parts[2:]).strip()
 
-        pattern = r"([^;]+);([0-9:apmAPM\- ]+)"
-        matches = re.findall(pattern, rest)
+def fetch_city_forecast(group: Dict[str, Any]):
+    if group["lat"] is None or group["lon"] is None:
+        return None
+    return get_daily_forecast(group["lat"], group["lon"], group["days"])
 
-        slots = []
-        for name, time_range in matches:
-            slots.append({"name": name.strip(), "time": time_range.strip()})
 
-        trip.append({"city": city, "date": date, "slots": slots})
+async def afetch_city_forecast(group: Dict[str, Any]):
+    if group["lat"] is None or group["lon"] is None:
+        return None
+    return await aget_daily_forecast(group["lat"], group["lon"], group["days"])
 
-    return trip
 
+def weather_by_day(trip: List[Dict[str, Any]], groups, forecasts) -> list:
+    """
+    Map each itinerary date to its matching forecastDays entry.
+    """
+    weather = [None] * len(trip)
 
-# -------------------------
-# 2) Build plan (tool calls)
-# -------------------------
-def build_plan(trip: List[Dict[str, Any]]) -> Dict[str, Any]:
+    for group, forecast in zip(groups, forecasts):
+        for i in group["day_indexes"]:
+            weather[i] = weather_for_date(forecast, trip[i]["date"])
+
+    return weather
+
+
+OUT_OF_WINDOW = "Date outside the forecast window"
+
+
+def weather_for_date(forecast, date: str):
+    if forecast is None or not forecast.get("ok"):
+        return forecast
+
+    return forecast["days"].get(date) or {"error": OUT_OF_WINDOW, "date": date}
+
+
+def day_entry(day: Dict[str, Any], resolved_slots, weather, air) -> Dict[str, Any]:
+    # Per-slot AQI / mask from the hourly series; the day needs a mask if any slot does
+    schedule = slot_air(day["date"], resolved_slots, air)
+    return {
+        "city": day["city"],
+        "date": day["date"],
+        "weather": weather,
+        "air_quality": air,
+        "mask_needed_today": day_mask(schedule, air),
+        "schedule": schedule,
+    }
+
+
+def assemble_plan(trip: List[Dict[str, Any]], resolved, weather, air) -> Dict[str, Any]:
+    days = [
+        day_entry(day, list(slots), w, a)
+        for day, slots, w, a in zip(trip, resolved, weather, air)
+    ]
+    return {
+        "days": days,
+        "total_masks": sum(1 for d in days if d["mask_needed_today"]),
+    }
+
+
+def build_plan(
+    trip: List[Dict[str, Any]],
+    concurrent: bool = False,
+    max_workers: Optional[int] = None,
+) -> Dict[str, Any]:
     """
     For each place: resolve name -> address, lat, lon
-    For each city/day: get weather + air quality using first resolved location
-    Compute total masks (1 per day if mask_needed_today)
+    For each city: one multi-day weather forecast, matched to each itinerary date
+    For each day: hourly air quality at the first resolved location, matched to
+    each slot's time window (slot aqi / mask_needed)
+    Compute total masks (1 per day if any slot, else the first forecast hour, needs one)
+
+    concurrent=True resolves every slot of every day at once on a bounded
+    thread pool, then runs the weather/AQ lookups in parallel.
+    The result is identical to the sequential path.
+
+    plan["timings"] is the per-run breakdown: wall time plus calls, seconds,
+    errors and bytes for each tool / LLM call made while building the plan.
     """
-    output: Dict[str, Any] = {"days": [], "total_masks": 0}
+    with metrics.run_timer() as run:
+        if concurrent:
+            plan = _build_plan_concurrent(trip, max_workers or MAX_WORKERS)
+        else:
+            plan = _build_plan_sequential(trip)
+    plan["timings"] = run.summary()
+    return plan
+
 
+def _build_plan_sequential(trip: List[Dict[str, Any]]) -> Dict[str, Any]:
+    prefetch_attractions(trip)
     for day in trip:
-        city = day["city"]
-        date = day["date"]
+        fill_generated_slots(day)
 
-        # HARD MODE:
-        # If no slots were provided, generate attraction names + random time slots
-        if not day.get("slots"):
-            gen = generate_attractions.invoke({"city": city})
-
-            possible_times = [
-                "9:00 AM – 10:30 AM",
-                "10:30 AM – 12:00 PM",
-                "1:00 PM – 2:30 PM",
-                "3:00 PM – 4:30 PM",
-                "5:00 PM – 6:30 PM",
-                "7:00 PM – 8:30 PM",
+    resolved = [[resolve_slot(s, day["city"]) for s in day.get("slots", [])] for day in trip]
+
+    groups = group_city_forecasts(trip, resolved)
+    forecasts = [fetch_city_forecast(g) for g in groups]
+    air = [lookup_air(*first_location(slots)) for slots in resolved]
+
+    return assemble_plan(trip, resolved, weather_by_day(trip, groups, forecasts), air)
+
+
+def _build_plan_concurrent(trip: List[Dict[str, Any]], max_workers: int) -> Dict[str, Any]:
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        # Stage 1: hard-mode attraction generation for days with no slots
+        # (one batched LLM call for all such cities, then per-day cache reads)
+        prefetch_attractions(trip)
+        for f in [metrics.submit_in_context(pool, fill_generated_slots, day) for day in trip]:
+            f.result()
+
+        # Stage 2: every slot across every day at once
+        slot_futures = [
+            [metrics.submit_in_context(pool, resolve_slot, s, day["city"]) for s in day.get("slots", [])]
+            for day in trip
+        ]
+        resolved = [[f.result() for f in futures] for futures in slot_futures]
+
+        # Stage 3: one forecast per city + AQ per day, all in parallel
+        groups = group_city_forecasts(trip, resolved)
+        forecast_futures = [metrics.submit_in_context(pool, fetch_city_forecast, g) for g in groups]
+        air_futures = [
+            metrics.submit_in_context(pool, lookup_air, *first_location(slots)) for slots in resolved
+        ]
+        forecasts = [f.result() for f in forecast_futures]
+        air = [f.result() for f in air_futures]
+
+    return assemble_plan(trip, resolved, weather_by_day(trip, groups, forecasts), air)
+
+
+async def abuild_plan(
+    trip: List[Dict[str, Any]],
+    max_concurrency: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Native async build_plan: same stages and output as build_plan(concurrent=True),
+    but every tool call is awaited on the event loop instead of using a thread.
+    max_concurrency bounds the in-flight tool calls for this plan.
+    """
+    with metrics.run_timer() as run:
+        plan = await _abuild_plan(trip, max_concurrency)
+    plan["timings"] = run.summary()
+    return plan
+
+
+async def _abuild_plan(trip: List[Dict[str, Any]], max_concurrency: Optional[int]) -> Dict[str, Any]:
+    sem = asyncio.Semaphore(max_concurrency or MAX_WORKERS)
+
+    async def bounded(coro):
+        async with sem:
+            return await coro
+
+    await aprefetch_attractions(trip)
+    await asyncio.gather(*(bounded(afill_generated_slots(day)) for day in trip))
+
+    resolved = await asyncio.gather(
+        *(
+            asyncio.gather(*(bounded(aresolve_slot(s, day["city"])) for s in day.get("slots", [])))
+            for day in trip
+        )
+    )
+
+    groups = group_city_forecasts(trip, resolved)
+    forecasts, air = await asyncio.gather(
+        asyncio.gather(*(bounded(afetch_city_forecast(g)) for g in groups)),
+        asyncio.gather(*(bounded(alookup_air(*first_location(slots))) for slots in resolved)),
+    )
+
+    return assemble_plan(trip, resolved, weather_by_day(trip, groups, forecasts), air)
+
+
+# -------------------------
+# 2b) Streaming plan (one day at a time)
+# -------------------------
+def city_spans(trip: List[Dict[str, Any]]) -> Dict[str, int]:
+    dates: Dict[str, List[str]] = {}
+    for day in trip:
+        dates.setdefault(day["city"].casefold(), []).append(day["date"])
+    return {city: forecast_span(d) for city, d in dates.items()}
+
+
+def _later_cities(trip: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Days whose attractions the streaming plans batch-prefetch in the background:
+    all but the first day's city, which generates its own so it is not held up.
+    """
+    first = normalize_key(trip[0]["city"])
+    return [day for day in trip[1:] if normalize_key(day["city"]) != first]
+
+
+def _needs_generated(day: Dict[str, Any]) -> bool:
+    # Slot-less and not in the catalog: its slots come from the attractions LLM call
+    return not day.get("slots") and catalog_places(day["city"]) is None
+
+
+def iter_plan(
+    trip: List[Dict[str, Any]],
+    max_workers: Optional[int] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yield each city/day block (same shape as build_plan()["days"][i]) as soon as
+    its places, weather and air quality are resolved, in itinerary order.
+
+    Weather is still one forecast per city, fetched on the first day of that city
+    that has a resolved location. The batch attractions call for later cities
+    runs while the first day is planned.
+    """
+    if not trip:
+        return
+    spans = city_spans(trip)
+    forecasts: Dict[str, Any] = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers or MAX_WORKERS) as pool, \
+            ThreadPoolExecutor(max_workers=1) as background:
+        prefetch = metrics.submit_in_context(background, prefetch_attractions, _later_cities(trip))
+        for i, day in enumerate(trip):
+            if i and _needs_generated(day):
+                prefetch.result()
+            fill_generated_slots(day)
+
+            city = day["city"]
+            slot_futures = [
+                metrics.submit_in_context(pool, resolve_slot, s, city) for s in day.get("slots", [])
             ]
+            resolved_slots = [f.result() for f in slot_futures]
 
-            # Stable randomness per city (so your demo doesn't change every run)
-            random.seed(city)
+            lat, lon = first_location(resolved_slots)
+            key = city.casefold()
 
-            used_times = set()
-            day["slots"] = []
+            forecast_future = None
+            if key not in forecasts and lat is not None:
+                group = {"lat": lat, "lon": lon, "days": spans[key]}
+                forecast_future = metrics.submit_in_context(pool, fetch_city_forecast, group)
+            air = lookup_air(lat, lon)
+            if forecast_future is not None:
+                forecasts[key] = forecast_future.result()
 
-            for name in gen.get("places", []):
-                available = [t for t in possible_times if t not in used_times]
-                if not available:
-                    available = possible_times
+            weather = weather_for_date(forecasts.get(key), day["date"])
+            yield day_entry(day, resolved_slots, weather, air)
 
-                time_slot = random.choice(available)
-                used_times.add(time_slot)
 
-                day["slots"].append({"name": name, "time": time_slot})
+async def aiter_plan(
+    trip: List[Dict[str, Any]],
+    max_concurrency: Optional[int] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Async-iterator version of iter_plan.
+    """
+    if not trip:
+        return
+    spans = city_spans(trip)
+    forecasts: Dict[str, Any] = {}
+    sem = asyncio.Semaphore(max_concurrency or MAX_WORKERS)
 
-        resolved_slots = []
-        city_lat = None
-        city_lon = None
+    async def bounded(coro):
+        async with sem:
+            return await coro
 
-        for s in day.get("slots", []):
-            place = places_text_search.invoke({"place_name": s["name"], "city": city})
+    prefetch = asyncio.ensure_future(aprefetch_attractions(_later_cities(trip)))
+    try:
+        for i, day in enumerate(trip):
+            if i and _needs_generated(day):
+                await prefetch
+            await afill_generated_slots(day)
+
+            city = day["city"]
+            resolved_slots = list(
+                await asyncio.gather(*(bounded(aresolve_slot(s, city)) for s in day.get("slots", [])))
+            )
+
+            lat, lon = first_location(resolved_slots)
+            key = city.casefold()
 
-            if place.get("error"):
-                resolved_slots.append(
-                    {"time": s.get("time", ""), "name": s["name"], "error": place.get("error")}
+            if key not in forecasts and lat is not None:
+                group = {"lat": lat, "lon": lon, "days": spans[key]}
+                forecasts[key], air = await asyncio.gather(
+                    afetch_city_forecast(group), alookup_air(lat, lon)
                 )
             else:
-                resolved_slots.append(
-                    {
-                        "time": s.get("time", ""),
-                        "name": place.get("name") or s["name"],
-                        "address": place.get("address"),
-                        "lat": place.get("lat"),
-                        "lon": place.get("lon"),
-                    }
-                )
-                if city_lat is None and city_lon is None:
-                    city_lat = place.get("lat")
-                    city_lon = place.get("lon")
-
-        weather = None
-        air = None
-        mask_today = False
-
-        if city_lat is not None and city_lon is not None:
-            weather = get_weather.invoke({"lat": city_lat, "lon": city_lon, "days": 2})
-            air = get_air_quality.invoke({"lat": city_lat, "lon": city_lon, "hours": 24})
-            mask_today = bool(air.get("mask_needed"))
-
-        if mask_today:
-            output["total_masks"] += 1
-
-        output["days"].append(
-            {
-                "city": city,
-                "date": date,
-                "weather": weather,
-                "air_quality": air,
-                "mask_needed_today": mask_today,
-                "schedule": resolved_slots,
-            }
+                air = await alookup_air(lat, lon)
+
+            weather = weather_for_date(forecasts.get(key), day["date"])
+            yield day_entry(day, resolved_slots, weather, air)
+    finally:
+        # Stopped early: don't leave the batch call running
+        prefetch.cancel()
+
+
+# -------------------------
+# 2c) Incremental replanning (follow-up edits on a thread)
+# -------------------------
+def _day_key(day: Dict[str, Any]):
+    return day["city"].casefold(), day["date"]
+
+
+def replan(trip: List[Dict[str, Any]], previous: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Rebuild a plan for a follow-up edit, reusing everything unchanged from the
+    previous {"trip", "plan"} of the thread:
+    - slots whose (city, place name) were already resolved keep their address/coords
+    - auto-generated days for the same city/date keep their generated slots
+    - weather is only fetched for cities whose location or dates changed
+    - air quality is only fetched for locations not seen before
+
+    The result matches build_plan(trip) and carries a "replan" counter dict
+    (plus the same "timings" breakdown as build_plan).
+    """
+    with metrics.run_timer() as run:
+        plan = _replan(trip, previous)
+    plan["timings"] = run.summary()
+    return plan
+
+
+def _failed_lookup(result) -> bool:
+    # A weather / AQ error other than "date out of the forecast window" may succeed on retry
+    return bool(result) and result.get("error") not in (None, OUT_OF_WINDOW)
+
+
+def _replan(trip: List[Dict[str, Any]], previous: Dict[str, Any]) -> Dict[str, Any]:
+    prev_days = {}
+    prev_places = {}
+    prev_air = {}
+    prev_weather = {}
+
+    for pday, pentry in zip(previous["trip"], previous["plan"]["days"]):
+        city, date = _day_key(pday)
+        prev_days[(city, date)] = pday
+        # Failed lookups are fetched again rather than carried through the thread
+        if pentry.get("weather") is not None and not _failed_lookup(pentry["weather"]):
+            prev_weather[(city, date)] = pentry["weather"]
+
+        for slot, resolved_slot in zip(pday.get("slots", []), pentry["schedule"]):
+            if not resolved_slot.get("error"):
+                prev_places[(city, slot["name"].casefold())] = resolved_slot
+
+        location = first_location(pentry["schedule"])
+        air_quality = pentry.get("air_quality")
+        if location[0] is not None and air_quality is not None and not air_quality.get("error"):
+            prev_air[location] = air_quality
+
+    prev_locations = {
+        g["city"]: (g["lat"], g["lon"])
+        for g in group_city_forecasts(
+            previous["trip"], [d["schedule"] for d in previous["plan"]["days"]]
+        )
+    }
+
+    stats = {key: 0 for key in (
+        "slots_reused", "slots_resolved",
+        "forecasts_reused", "forecasts_fetched",
+        "air_reused", "air_fetched",
+    )}
+
+    # Slots: reuse generated slots and already-resolved places
+    prefetch_attractions(
+        [d for d in trip if not (prev_days.get(_day_key(d)) or {}).get("generated")]
+    )
+    resolved = []
+    for day in trip:
+        city, date = _day_key(day)
+        prev = prev_days.get((city, date))
+
+        if not day.get("slots"):
+            if prev is not None and prev.get("generated"):
+                day["slots"] = [dict(s) for s in prev["slots"]]
+                day["generated"] = True
+            else:
+                fill_generated_slots(day)
+
+        day_slots = []
+        for s in day.get("slots", []):
+            known = prev_places.get((city, s["name"].casefold()))
+            if known is not None:
+                day_slots.append({**known, "time": s.get("time", "")})
+                stats["slots_reused"] += 1
+            else:
+                day_slots.append(resolve_slot(s, day["city"]))
+                stats["slots_resolved"] += 1
+        resolved.append(day_slots)
+
+    # Weather: one forecast per city, unless every date is already known for that location
+    groups = group_city_forecasts(trip, resolved)
+    weather = [None] * len(trip)
+    for g in groups:
+        keys = [_day_key(trip[i]) for i in g["day_indexes"]]
+        unchanged = prev_locations.get(g["city"]) == (g["lat"], g["lon"]) and all(
+            k in prev_weather for k in keys
         )
 
-    return output
+        if unchanged:
+            for i, k in zip(g["day_indexes"], keys):
+                weather[i] = prev_weather[k]
+            stats["forecasts_reused"] += 1
+            continue
+
+        forecast = fetch_city_forecast(g)
+        if forecast is not None:
+            stats["forecasts_fetched"] += 1
+        for i in g["day_indexes"]:
+            weather[i] = weather_for_date(forecast, trip[i]["date"])
+
+    # Air quality: per location
+    air = []
+    for slots in resolved:
+        location = first_location(slots)
+        if location in prev_air:
+            air.append(prev_air[location])
+            stats["air_reused"] += 1
+        else:
+            air.append(lookup_air(*location))
+            if location[0] is not None:
+                stats["air_fetched"] += 1
+                prev_air[location] = air[-1]
+
+    plan = assemble_plan(trip, resolved, weather, air)
+    plan["replan"] = stats
+    return plan
+
+
+# -------------------------
+# 2d) Whole-plan cache (identical itineraries)
+# -------------------------
+def plan_from_cache(trip: List[Dict[str, Any]]):
+    """
+    (key, entry) for a freshly parsed trip; entry is None on a miss, else
+    {"trip": trip with generated slots, "plan": ..., "rendered": {renderer: text}}.
+    Call before build_plan: planning fills generated slots into the trip.
+    """
+    key = plan_cache_key(trip)
+    hit, entry = plan_cache.get(key)
+    return key, (entry if hit else None)
+
+
+def remember_plan(key: str, trip, plan, rendered: Optional[Dict[str, str]] = None) -> None:
+    # An itinerary that parsed to no days is never a plan worth serving again
+    if not plan.get("days"):
+        return
+    # A failed weather / AQ lookup (or an unavailable Places API) may succeed on
+    # retry: don't pin it for PLAN_CACHE_TTL
+    for day in plan.get("days", []):
+        air = day.get("air_quality") or {}
+        if air.get("error") or _failed_lookup(day.get("weather")):
+            return
+        if any(s.get("error") not in (None, "No results found") for s in day.get("schedule") or []):
+            return
+    plan_cache.set(key, {"trip": trip, "plan": plan, "rendered": rendered or {}})
+
+
+def cached_build_plan(trip: List[Dict[str, Any]], **kwargs) -> Dict[str, Any]:
+    """
+    build_plan behind the whole-plan cache (same arguments).
+    """
+    key, entry = plan_from_cache(trip)
+    if entry is not None:
+        return entry["plan"]
+
+    plan = build_plan(trip, **kwargs)
+    remember_plan(key, trip, plan)
+    return plan
 
 
 # -------------------------
 # 3) Agent (memory enabled)
 # -------------------------
-llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
-checkpointer = MemorySaver()
+# Every model call's tokens / latency are recorded as "model.agent" (usage.py)
+llm = ChatOpenAI(model="gpt-4o-mini", temperature=0, callbacks=[ModelUsageCallback("agent")])
+# CHECKPOINTER=sqlite (default, bounded + survives restarts) or memory
+checkpointer = make_checkpointer()
 
 agent = create_agent(
     model=llm,
     tools=[generate_attractions, places_text_search, get_weather, get_air_quality],
     system_prompt=SYSTEM,
     checkpointer=checkpointer,
+    # Earlier turns become a rolling summary under HISTORY_TOKEN_CEILING tokens
+    middleware=[PlanHistoryMiddleware()],
 )
 
 
-def run_agent(user_text: str, thread_id: str = "trip-thread-1") -> str:
-    trip = parse_hard_input(user_text)
-    plan = build_plan(trip)
-
-    prompt = f"""
+FORMAT_PROMPT = """
 Format the following PLAN_DATA as a final itinerary.
 
+PLAN_DATA is compact JSON: each day has city, date, weather, air, mask (mask needed that day)
+and slots, one row per time slot with the columns listed in slot_fields.
+
 Requirements:
 - Show TOTAL masks needed at the top.
-- For each city/date: show weather summary (today_day/today_night if present), air quality (aqi/category if present), and mask_needed_today.
-- Then list each time slot with the attraction name + full address.
+- For each city/date: show the weather summary, air quality, and whether a mask is needed.
+- Then list each time slot with the attraction name + full address (and the slot's AQI / mask if present).
 - Keep it clean and readable.
 
 PLAN_DATA:
 {plan}
 """
 
-    result = agent.invoke(
-        {
-            "messages": [
-                ("user", prompt),
-            ]
-        },
-        config={"configurable": {"thread_id": thread_id}},
-    )
 
+# "local" formats the plan with render.render_plan (no LLM round trip);
+# "llm" sends PLAN_DATA to the agent for formatting (and keeps it in thread memory)
+DEFAULT_RENDERER = os.getenv("PLAN_RENDERER", "local")
+
+
+def format_messages(plan: Dict[str, Any]) -> Dict[str, Any]:
+    # Compact PLAN_DATA within PROMPT_TOKEN_BUDGET (see compact.py for the report)
+    plan_data, _ = compact_plan(plan)
+    return {"messages": [("user", FORMAT_PROMPT.format(plan=plan_data))]}
+
+
+def run_agent(
+    user_text: str,
+    thread_id: str = "trip-thread-1",
+    concurrent: bool = False,
+    renderer: Optional[str] = None,
+) -> str:
+    return run_agent_with_usage(user_text, thread_id, concurrent, renderer)["text"]
+
+
+def run_agent_with_usage(
+    user_text: str,
+    thread_id: str = "trip-thread-1",
+    concurrent: bool = False,
+    renderer: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    run_agent, returning {"text", "usage", "thread_usage"}:
+    usage is this run's LLM calls / tokens / model latency / cost, Google API
+    requests and itinerary shape; thread_usage is the running total for thread_id.
+    """
+    trip = parse_reporting_errors(user_text)
+    renderer = renderer or DEFAULT_RENDERER
+
+    if not trip:
+        # No days to plan (a question about the current plan, say): keep the thread's plan
+        with metrics.run_timer() as run:
+            text = follow_up(user_text, thread_id)
+        return _with_usage(text, thread_id, trip, run, False)
+
+    with metrics.run_timer() as run:
+        # Same itinerary (from any thread) in the current forecast bucket: no tool calls
+        key, cached = plan_from_cache(trip)
+        if cached is not None:
+            trip, plan = cached["trip"], cached["plan"]
+        else:
+            # Follow-ups on the same thread only re-resolve what changed
+            hit, previous = plan_store.get(thread_id)
+            plan = replan(trip, previous) if hit else build_plan(trip, concurrent=concurrent)
+        plan_store.set(thread_id, {"trip": trip, "plan": plan})
+
+        rendered = dict(cached["rendered"]) if cached is not None else {}
+        if renderer not in rendered:
+            if renderer == "local":
+                rendered[renderer] = render_plan(plan)
+            else:
+                with metrics.timed("llm.format_plan") as call:
+                    result = agent.invoke(format_messages(plan), config={"configurable": {"thread_id": thread_id}})
+                    call["bytes"] = len(result["messages"][-1].content)
+                rendered[renderer] = result["messages"][-1].content
+            remember_plan(key, trip, plan, rendered)
+
+    return _with_usage(rendered[renderer], thread_id, trip, run, cached is not None)
+
+
+def follow_up(user_text: str, thread_id: str) -> str:
+    """
+    The agent's reply to a message with no itinerary days, from the thread's memory.
+    """
+    with metrics.timed("llm.follow_up") as call:
+        result = agent.invoke({"messages": [("user", user_text)]}, config={"configurable": {"thread_id": thread_id}})
+        call["bytes"] = len(result["messages"][-1].content)
     return result["messages"][-1].content
 
 
-if __name__ == "__main__":
+async def afollow_up(user_text: str, thread_id: str) -> str:
+    with metrics.timed("llm.follow_up") as call:
+        result = await agent.ainvoke(
+            {"messages": [("user", user_text)]}, config={"configurable": {"thread_id": thread_id}}
+        )
+        call["bytes"] = len(result["messages"][-1].content)
+    return result["messages"][-1].content
+
+
+def _with_usage(text: str, thread_id: str, trip, run: metrics.RunTimings, cache_hit: bool) -> Dict[str, Any]:
+    usage = run_usage(run.summary(), trip, cache_hit)
+    return {"text": text, "usage": usage, "thread_usage": add_thread_usage(thread_id, usage)}
+
+
+async def arun_agent(
+    user_text: str,
+    thread_id: str = "trip-thread-1",
+    renderer: Optional[str] = None,
+) -> str:
+    """
+    Async run_agent: tools and the formatting LLM call are awaited, so one
+    event loop can serve many trip plans at once.
+    """
+    return (await arun_agent_with_usage(user_text, thread_id, renderer))["text"]
+
+
+async def arun_agent_with_usage(
+    user_text: str,
+    thread_id: str = "trip-thread-1",
+    renderer: Optional[str] = None,
+) -> Dict[str, Any]:
+    trip = parse_reporting_errors(user_text)
+    renderer = renderer or DEFAULT_RENDERER
+
+    if not trip:
+        with metrics.run_timer() as run:
+            text = await afollow_up(user_text, thread_id)
+        return await asyncio.to_thread(_with_usage, text, thread_id, trip, run, False)
+
+    with metrics.run_timer() as run:
+        # The plan cache, plan store and usage store are SQLite: never query them on the event loop
+        key, cached = await asyncio.to_thread(plan_from_cache, trip)
+        if cached is not None:
+            trip, plan = cached["trip"], cached["plan"]
+        else:
+            hit, previous = await plan_store.aget(thread_id)
+            if hit:
+                # Usually only a few tool calls; keep the event loop free while they run
+                plan = await asyncio.to_thread(replan, trip, previous)
+            else:
+                plan = await abuild_plan(trip)
+        await plan_store.aset(thread_id, {"trip": trip, "plan": plan})
+
+        rendered = dict(cached["rendered"]) if cached is not None else {}
+        if renderer not in rendered:
+            if renderer == "local":
+                rendered[renderer] = render_plan(plan)
+            else:
+                with metrics.timed("llm.format_plan") as call:
+                    result = await agent.ainvoke(
+                        format_messages(plan), config={"configurable": {"thread_id": thread_id}}
+                    )
+                    call["bytes"] = len(result["messages"][-1].content)
+                rendered[renderer] = result["messages"][-1].content
+            await asyncio.to_thread(remember_plan, key, trip, plan, rendered)
+
+    return await asyncio.to_thread(_with_usage, rendered[renderer], thread_id, trip, run, cached is not None)
+
+
+def stream_itinerary(user_text: str) -> Iterator[str]:
+    """
+    Rendered text for each city/day as soon as it is planned, then the mask total.
+    """
+    total_masks = 0
+    for day in iter_plan(parse_reporting_errors(user_text)):
+        total_masks += day["mask_needed_today"]
+        yield "\n".join(render_day(day)) + "\n"
+    yield f"TOTAL masks needed: {total_masks}\n"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Plan a hard-mode itinerary.")
+    parser.add_argument(
+        "--stream", action="store_true", help="print each city/day as soon as it is planned"
+    )
+    parser.add_argument("--renderer", choices=["local", "llm"], default=None)
+    parser.add_argument("--concurrent", action="store_true", help="resolve all slots at once")
+    parser.add_argument(
+        "--metrics", choices=["json", "prometheus"], default=None,
+        help="print per-tool call counts / latency / errors / bytes when done",
+    )
+    args = parser.parse_args(argv)
+
     hard_input = input("Paste hard-mode itinerary text:\n")
-    print("\n" + run_agent(hard_input))
 
+    result = None
+    if args.stream:
+        print()
+        for block in stream_itinerary(hard_input):
+            print(block, flush=True)
+    else:
+        result = run_agent_with_usage(hard_input, concurrent=args.concurrent, renderer=args.renderer)
+        print("\n" + result["text"])
 
-def main():
-    hard_input = input('Paste hard-mode itinerary text:\n')
-    print('\n' + run_agent(hard_input))
+    if args.metrics == "json":
+        report = {
+            "calls": metrics.registry.to_json(),
+            "api_requests": metrics.registry.api_requests(),
+            "prompt_compaction": compaction_stats(),
+        }
+        if result is not None:
+            report["run_usage"] = result["usage"]
+        print(json.dumps(report, indent=2))
+    elif args.metrics == "prometheus":
+        print(metrics.registry.to_prometheus(), end="")
 
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import re
+import bisect
+import datetime as dt
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+
+# "8am", "9:30 AM", "14:00", "1 p.m."
+_TIME = r"(\d{1,2})(?::(\d{2}))?\s*([ap])?\.?\s*(?:m\.?)?"
+SLOT_RE = re.compile(rf"^\s*{_TIME}\s*(?:(?:-|–|—|to)\s*{_TIME})?\s*$", re.IGNORECASE)
+
+_EPOCH = dt.datetime(1970, 1, 1)
+
+
+def _to_minutes(hour: str, minute: Optional[str], meridiem: Optional[str]) -> Optional[int]:
+    h = int(hour)
+    m = int(minute or 0)
+    if meridiem:
+        if not 1 <= h <= 12:
+            return None
+        h = h % 12 + (12 if meridiem.lower() == "p" else 0)
+    if h > 24 or m > 59:
+        return None
+    return h * 60 + m
+
+
+def parse_slot_window(text: str) -> Optional[Tuple[int, int]]:
+    """
+    "8am-9am" / "9:00 AM – 10:30 AM" / "14:00-15:30" / "3pm" -> (start, end) in
+    minutes after local midnight. A single time means a one-hour slot; "8-9am"
+    borrows the am/pm of the end time. None when the text is not a time range.
+    """
+    m = SLOT_RE.match(text or "")
+    if not m:
+        return None
+
+    h1, m1, p1, h2, m2, p2 = m.groups()
+    if h2 is None:
+        start = _to_minutes(h1, m1, p1)
+        return None if start is None else (start, start + 60)
+
+    if p1 is None and p2 is not None:
+        p1 = p2
+        # "11-1pm": the start is still in the morning
+        if p2.lower() == "p" and int(h1) < 12 and int(h1) > int(h2):
+            p1 = "a"
+
+    start = _to_minutes(h1, m1, p1)
+    end = _to_minutes(h2, m2, p2)
+    if start is None or end is None:
+        return None
+    if end <= start:
+        end = start + 60
+    return start, end
+
+
+def utc_offset_hours(lon: Optional[float]) -> int:
+    """
+    Solar-time offset from longitude. The Air Quality API only reports UTC and
+    has no time zone field, so this is an approximation (off by DST / political zones).
+    """
+    return int(round((lon or 0.0) / 15.0))
+
+
+class HourlySeries:
+    """
+    The hourly AQI forecast of one location as two flat arrays:
+    epoch hours (sorted) and AQI * 10 + mask bit (-1 = hour without an AQI).
+    """
+
+    __slots__ = ("hours", "values")
+
+    def __init__(self, hourly: Dict[str, Any]):
+        start = _parse_utc(hourly.get("start"))
+        aqi = hourly.get("aqi") or []
+        mask = hourly.get("mask") or [0] * len(aqi)
+
+        self.hours = array("l")
+        self.values = array("l")
+        if start is None:
+            return
+
+        base = int((start - _EPOCH).total_seconds() // 3600)
+        for i, (a, flag) in enumerate(zip(aqi, mask)):
+            self.hours.append(base + i)
+            self.values.append(-1 if a is None else int(a) * 10 + (1 if flag else 0))
+
+    def window(self, start_hour: int, end_hour: int) -> Tuple[Optional[int], Optional[bool]]:
+        """
+        Worst AQI and mask flag over epoch hours [start_hour, end_hour).
+        (None, None) when the window is outside the forecast.
+        """
+        lo = bisect.bisect_left(self.hours, start_hour)
+        hi = bisect.bisect_left(self.hours, end_hour, lo)
+        values = [v for v in self.values[lo:hi] if v >= 0]
+        if not values:
+            return None, None
+        return max(v // 10 for v in values), any(v % 10 for v in values)
+
+
+def _parse_utc(value: Optional[str]) -> Optional[dt.datetime]:
+    if not value:
+        return None
+    try:
+        parsed = dt.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return parsed.replace(tzinfo=None) - (parsed.utcoffset() or dt.timedelta())
+
+
+def _slot_hours(date: str, window: Tuple[int, int], offset: int) -> Optional[Tuple[int, int]]:
+    try:
+        day = dt.date.fromisoformat(date)
+    except (TypeError, ValueError):
+        return None
+    midnight = int((dt.datetime(day.year, day.month, day.day) - _EPOCH).total_seconds() // 3600) - offset
+    start, end = window
+    # Every hour the slot touches: 9:30-10:30 covers the 9:00 and 10:00 forecasts
+    return midnight + start // 60, midnight + (end + 59) // 60
+
+
+def slot_air(date: str, slots: List[Dict[str, Any]], air: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Copy of each resolved slot with "aqi" and "mask_needed" for its own time
+    window, read from the location's hourly series (no extra API calls).
+    Slots without a parsable time or outside the forecast get None for both.
+    """
+    hourly = (air or {}).get("hourly")
+    series = HourlySeries(hourly) if hourly else None
+    # Every slot of the day shares the air-quality location (the first resolved place)
+    offset = utc_offset_hours(next((s.get("lon") for s in slots if not s.get("error")), None))
+
+    out = []
+    for s in slots:
+        aqi = mask = None
+        window = parse_slot_window(s.get("time", ""))
+        if series is not None and window is not None:
+            hours = _slot_hours(date, window, offset)
+            if hours is not None:
+                aqi, mask = series.window(*hours)
+        out.append({**s, "aqi": aqi, "mask_needed": mask})
+    return out
+
+
+def day_mask(slots: List[Dict[str, Any]], air: Optional[Dict[str, Any]]) -> bool:
+    """
+    A mask is needed if any slot needs one; with no per-slot data, fall back to
+    the first forecast hour (the old per-day rule).
+    """
+    flags = [s["mask_needed"] for s in slots if s.get("mask_needed") is not None]
+    if flags:
+        return any(flags)
+    return bool(air.get("mask_needed")) if air else False
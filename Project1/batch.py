@@ -0,0 +1,175 @@
+"""
+Bulk itinerary planning.
+
+Reads many hard-mode itineraries from a file (or stdin), plans them with bounded
+concurrency, and streams one JSON line per finished plan. Itineraries are separated
+by a blank line, or start whenever a new "City1:" line appears.
+
+Usage:
+    uv run python batch.py itineraries.txt --workers 8 > plans.jsonl
+    cat itineraries.txt | uv run python batch.py - --output plans.jsonl
+"""
+import sys
+import json
+import time
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, Iterable, Iterator, List, TextIO, Tuple
+
+import ratelimit
+import resilience
+from itinerary import iter_text_days
+from agent_app_fixed import cached_build_plan
+
+STAGES = ("parse", "plan")
+
+
+def read_itineraries(lines: Iterable[str]) -> Iterator[Tuple[int, str]]:
+    """
+    Lazily split an input stream into (first line number, itinerary text).
+    Lines are kept as they are, so parse errors point at the input file.
+    """
+    current: List[str] = []
+    first_line = 1
+
+    for line_no, line in enumerate(lines, 1):
+        stripped = line.strip()
+        starts_new = stripped.lower().startswith("city1:") and current
+
+        if not stripped or starts_new:
+            if current:
+                yield first_line, "\n".join(current)
+                current = []
+            if not stripped:
+                continue
+
+        if not current:
+            first_line = line_no
+        current.append(line.rstrip("\r\n"))
+
+    if current:
+        yield first_line, "\n".join(current)
+
+
+def plan_one(index: int, text: str, first_line: int = 1) -> Dict:
+    timings = {}
+
+    t0 = time.perf_counter()
+    errors = []
+    trip = list(iter_text_days(text, errors, first_line))
+    timings["parse"] = time.perf_counter() - t0
+    # Malformed slots are skipped; the row says which ones
+    parse_errors = {"parse_errors": [e.as_dict() for e in errors]} if errors else {}
+
+    t0 = time.perf_counter()
+    try:
+        # Repeated itineraries in one run (or recent runs) come from the plan cache
+        plan = cached_build_plan(trip)
+    except Exception as e:
+        timings["plan"] = time.perf_counter() - t0
+        return {
+            "index": index, "input": text, "error": f"{type(e).__name__}: {e}", **parse_errors, "timings": timings,
+        }
+    timings["plan"] = time.perf_counter() - t0
+
+    return {"index": index, "input": text, "plan": plan, **parse_errors, "timings": timings}
+
+
+def run_batch(
+    itineraries: Iterable[Tuple[int, str]],
+    out: TextIO,
+    workers: int = 8,
+) -> Tuple[int, int, Dict[str, List[float]]]:
+    """
+    Plan every itinerary with at most `workers` in flight and write each result as
+    soon as it finishes (completion order; use "index" to restore input order).
+    Returns (planned, failed, per-stage timings).
+    """
+    stage_times: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+    planned = failed = 0
+
+    def emit(result: Dict) -> None:
+        nonlocal planned, failed
+        out.write(json.dumps(result, ensure_ascii=False) + "\n")
+        out.flush()
+        for stage, seconds in result["timings"].items():
+            stage_times[stage].append(seconds)
+        if "error" in result:
+            failed += 1
+        else:
+            planned += 1
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for index, (first_line, text) in enumerate(itineraries):
+            # Keep memory flat on huge inputs: never queue more than 2x workers
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for f in done:
+                    emit(f.result())
+            pending.add(pool.submit(plan_one, index, text, first_line))
+
+        for f in pending:
+            emit(f.result())
+
+    return planned, failed, stage_times
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[int(q) - 1]
+
+
+def format_report(planned: int, failed: int, stage_times: Dict[str, List[float]], elapsed: float) -> str:
+    total = planned + failed
+    lines = [
+        f"itineraries: {total} (ok {planned}, failed {failed})",
+        f"elapsed: {elapsed:.2f}s  throughput: {total / elapsed if elapsed else 0:.2f} itineraries/s",
+    ]
+    for stage, values in stage_times.items():
+        if not values:
+            continue
+        lines.append(
+            f"{stage:>6}: total {sum(values):.2f}s  mean {statistics.mean(values) * 1000:.1f}ms  "
+            f"p50 {_percentile(values, 50) * 1000:.1f}ms  p95 {_percentile(values, 95) * 1000:.1f}ms"
+        )
+
+    # Time spent queued on the per-API quota budgets (see ratelimit.py)
+    quota = ratelimit.format_stats()
+    if quota:
+        lines.append(quota)
+    # Circuit breakers that tripped / hedged requests (see resilience.py)
+    breakers = resilience.format_stats()
+    if breakers:
+        lines.append(breakers)
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Plan many hard-mode itineraries, one JSON line each.")
+    parser.add_argument("input", nargs="?", default="-", help="itinerary file, or - for stdin")
+    parser.add_argument("--output", "-o", default="-", help="JSONL output file, or - for stdout")
+    parser.add_argument("--workers", "-w", type=int, default=8, help="itineraries planned at once")
+    args = parser.parse_args(argv)
+
+    src = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+
+    start = time.perf_counter()
+    try:
+        planned, failed, stage_times = run_batch(read_itineraries(src), out, workers=args.workers)
+    finally:
+        if src is not sys.stdin:
+            src.close()
+        if out is not sys.stdout:
+            out.close()
+
+    print(format_report(planned, failed, stage_times, time.perf_counter() - start), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+"""
+Offline planning benchmark.
+
+Starts stub_server.py (or uses --base-url), points tools.py at it, then drives
+build_plan (sequential / concurrent / async) and run_agent (local renderer) over
+itineraries of increasing size, reporting throughput and p50/p95/p99 latency.
+
+Usage:
+    uv run python benchmark.py --iterations 20 --concurrency 4 --latency-ms 50
+    uv run python benchmark.py --modes build_plan,abuild_plan --sizes 1x2,5x6 --json
+    uv run python benchmark.py --parser-mb 8    # itinerary parser only, no stub
+"""
+import os
+import re
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import tracemalloc
+import datetime as dt
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Tuple
+
+from itinerary import iter_days, parse_itinerary
+from stub_server import StubConfig, start_stub_server
+
+CITIES = ["Toronto", "Chicago", "Paris", "Tokyo", "Rome", "Sydney", "Lima", "Cairo"]
+TIMES = ["8am-9am", "9am-10am", "10am-11am", "11am-12pm", "1pm-2pm", "2pm-3pm", "3pm-4pm", "5pm-6pm"]
+MODES = ["build_plan", "build_plan_concurrent", "abuild_plan", "run_agent"]
+
+
+def make_itinerary(cities: int, slots: int, variant: int, place: str = "Attraction") -> str:
+    """
+    Hard-mode text with `cities` days of `slots` places each. Place names include
+    `variant` so every iteration misses the caches (cold-path latency).
+    """
+    today = dt.date.today()
+    lines = []
+    for c in range(cities):
+        city = CITIES[c % len(CITIES)]
+        date = today + dt.timedelta(days=c)
+        places = " ".join(
+            f"{place} {variant}-{c}-{s};{TIMES[s % len(TIMES)]}" for s in range(slots)
+        )
+        lines.append(f"City{c + 1}: {city} {date} {places}")
+    return "\n".join(lines)
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    pos = (len(ordered) - 1) * q / 100
+    lo = int(pos)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo)
+
+
+def _timed(fn: Callable, *args) -> float:
+    t0 = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - t0
+
+
+def run_sync(fn: Callable[[str], object], texts: List[str], concurrency: int) -> Tuple[List[float], float]:
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(lambda text: _timed(fn, text), texts))
+    return latencies, time.perf_counter() - start
+
+
+def run_async(afn, texts: List[str], concurrency: int) -> Tuple[List[float], float]:
+    # Imported lazily, like in benchmark(): ratelimit reads the *_QPS quotas at import time
+    import http_client
+
+    async def go():
+        sem = asyncio.Semaphore(concurrency)
+
+        async def one(text):
+            async with sem:
+                t0 = time.perf_counter()
+                await afn(text)
+                return time.perf_counter() - t0
+
+        try:
+            return await asyncio.gather(*(one(t) for t in texts))
+        finally:
+            await http_client.aclose_all()
+
+    start = time.perf_counter()
+    latencies = asyncio.run(go())
+    return list(latencies), time.perf_counter() - start
+
+
+def benchmark(modes: List[str], sizes: List[Tuple[int, int]], iterations: int, concurrency: int) -> List[Dict]:
+    # Imported here: tools.py reads GOOGLE_API_BASE_URL / cache paths and ratelimit.py
+    # the *_QPS quotas at import time
+    import cache
+    from agent_app_fixed import build_plan, abuild_plan, parse_hard_input, run_agent
+
+    runners = {
+        "build_plan": lambda text: run_sync(lambda t: build_plan(parse_hard_input(t)), text, concurrency),
+        "build_plan_concurrent": lambda text: run_sync(
+            lambda t: build_plan(parse_hard_input(t), concurrent=True), text, concurrency
+        ),
+        "abuild_plan": lambda text: run_async(lambda t: abuild_plan(parse_hard_input(t)), text, concurrency),
+        # A fresh thread per itinerary so nothing is replanned
+        "run_agent": lambda text: run_sync(
+            lambda t: run_agent(t, thread_id=f"bench-{id(t)}-{time.perf_counter_ns()}", renderer="local"),
+            text,
+            concurrency,
+        ),
+    }
+
+    results = []
+    variant = 0
+    for cities, slots in sizes:
+        for mode in modes:
+            texts = []
+            for _ in range(iterations):
+                variant += 1
+                texts.append(make_itinerary(cities, slots, variant))
+
+            cache.weather_cache.clear()
+            cache.air_cache.clear()
+
+            latencies, wall = runners[mode](texts)
+            results.append(
+                {
+                    "mode": mode,
+                    "size": f"{cities}x{slots}",
+                    "plans": len(latencies),
+                    "throughput_per_s": round(len(latencies) / wall, 2) if wall else 0.0,
+                    "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+                    "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+                    "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+                }
+            )
+    return results
+
+
+# -------------------------
+# Itinerary parser
+# -------------------------
+def _legacy_parse(text: str) -> List[Dict[str, Any]]:
+    # parse_hard_input before itinerary.py, kept as the baseline
+    blocks = re.split(r"City\d+\s*:\s*", text.strip())
+    blocks = [b.strip() for b in blocks if b.strip()]
+
+    trip = []
+    for b in blocks:
+        parts = b.split()
+        if len(parts) < 2:
+            continue
+        rest = " ".join(parts[2:]).strip()
+        matches = re.findall(r"([^;]+);([0-9:apmAPM\- ]+)", rest)
+        slots = [{"name": name.strip(), "time": time_range.strip()} for name, time_range in matches]
+        trip.append({"city": parts[0], "date": parts[1], "slots": slots})
+    return trip
+
+
+def _parse_file(path: str) -> int:
+    # Streaming: only the current line and day are held
+    with open(path, encoding="utf-8") as f:
+        return sum(1 for _ in iter_days(f, []))
+
+
+def _peak_bytes(fn: Callable, *args) -> int:
+    tracemalloc.start()
+    try:
+        fn(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def benchmark_parser(megabytes: float, repeats: int = 3) -> List[Dict]:
+    """
+    Parse one itinerary of about `megabytes` MB (8 slots per day) with the old
+    regex parser, parse_itinerary and iter_days over a file; best-of-`repeats`
+    time, throughput and peak memory (traced in a separate run).
+    """
+    # "Landmark": the old parser drops a leading a/p/m from place names
+    day = make_itinerary(1, 8, 0, place="Landmark")
+    days = max(1, int(megabytes * 1024 * 1024 / (len(day) + 1)))
+    text = make_itinerary(days, 8, 0, place="Landmark")
+    size_mb = len(text.encode("utf-8")) / (1024 * 1024)
+
+    fd, path = tempfile.mkstemp(prefix="travel-itinerary-", suffix=".txt")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(text)
+
+    reference = parse_itinerary(text)
+    parsers = {
+        "legacy_regex": (lambda: len(_legacy_parse(text)), lambda: _legacy_parse(text) == reference),
+        "parse_itinerary": (lambda: len(parse_itinerary(text)), lambda: True),
+        "iter_days_file": (lambda: _parse_file(path), lambda: True),
+    }
+
+    results = []
+    try:
+        for name, (run, same) in parsers.items():
+            best = float("inf")
+            for _ in range(repeats):
+                t0 = time.perf_counter()
+                parsed_days = run()
+                best = min(best, time.perf_counter() - t0)
+            results.append(
+                {
+                    "parser": name,
+                    "mb": round(size_mb, 2),
+                    "days": parsed_days,
+                    "seconds": round(best, 3),
+                    "mb_per_s": round(size_mb / best, 1) if best else 0.0,
+                    "peak_mb": round(_peak_bytes(run) / (1024 * 1024), 1),
+                    "same_as_parse_itinerary": same(),
+                }
+            )
+    finally:
+        os.remove(path)
+    return results
+
+
+def format_parser_table(results: List[Dict]) -> str:
+    header = f"{'parser':<16} {'MB':>7} {'days':>8} {'seconds':>8} {'MB/s':>7} {'peak MB':>8}  same"
+    rows = [header, "-" * len(header)]
+    for r in results:
+        rows.append(
+            f"{r['parser']:<16} {r['mb']:>7} {r['days']:>8} {r['seconds']:>8} {r['mb_per_s']:>7} "
+            f"{r['peak_mb']:>8}  {r['same_as_parse_itinerary']}"
+        )
+    return "\n".join(rows)
+
+
+def format_table(results: List[Dict]) -> str:
+    header = f"{'mode':<22} {'size':>6} {'plans':>6} {'plans/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+    rows = [header, "-" * len(header)]
+    for r in results:
+        rows.append(
+            f"{r['mode']:<22} {r['size']:>6} {r['plans']:>6} {r['throughput_per_s']:>9} "
+            f"{r['p50_ms']:>9} {r['p95_ms']:>9} {r['p99_ms']:>9}"
+        )
+    return "\n".join(rows)
+
+
+def _parse_sizes(value: str) -> List[Tuple[int, int]]:
+    sizes = []
+    for part in value.split(","):
+        cities, _, slots = part.partition("x")
+        sizes.append((int(cities), int(slots or 1)))
+    return sizes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Project1 planning against the local stub APIs.")
+    parser.add_argument("--base-url", help="use an already running stub_server.py instead of starting one")
+    parser.add_argument("--sizes", default="1x2,3x4,5x6", help="comma list of <cities>x<slots per city>")
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--iterations", type=int, default=20, help="plans per mode and size")
+    parser.add_argument("--concurrency", type=int, default=4, help="plans in flight at once")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="stub latency (in-process stub only)")
+    parser.add_argument("--jitter-ms", type=float, default=20.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--qps", type=float, default=0.0,
+        help="pace each API at this many requests/s (default 0: unpaced, the stub has no quota)",
+    )
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--parser-mb", type=float, help="only benchmark the itinerary parser on this many MB")
+    args = parser.parse_args(argv)
+
+    if args.parser_mb:
+        results = benchmark_parser(args.parser_mb)
+        print(json.dumps(results, indent=2) if args.json else format_parser_table(results))
+        return
+
+    modes = [m for m in args.modes.split(",") if m]
+    unknown = set(modes) - set(MODES)
+    if unknown:
+        parser.error(f"unknown modes: {', '.join(sorted(unknown))}")
+
+    server = None
+    base_url = args.base_url
+    if not base_url:
+        config = StubConfig(args.latency_ms, args.jitter_ms, args.error_rate)
+        server, base_url = start_stub_server(config=config)
+
+    # Keep benchmark data out of the real caches; never call OpenAI (slots are always given)
+    os.environ["GOOGLE_API_BASE_URL"] = base_url
+    os.environ["TRAVEL_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="travel-bench-"), "cache.sqlite")
+    os.environ["CHECKPOINTER"] = "memory"
+    for quota in ("PLACES_QPS", "WEATHER_QPS", "AIR_QUALITY_QPS"):
+        os.environ[quota] = str(args.qps)
+    os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+
+    try:
+        results = benchmark(modes, _parse_sizes(args.sizes), args.iterations, args.concurrency)
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    print(json.dumps(results, indent=2) if args.json else format_table(results))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,274 @@
+import os
+import json
+import asyncio
+import time
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+# One SQLite file holds every persistent cache (one table per cache)
+CACHE_PATH = os.getenv(
+    "TRAVEL_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "travel_cache.sqlite"),
+)
+
+
+def normalize_key(*parts: str) -> str:
+    """
+    Case/whitespace-insensitive key: ("CN  Tower", "toronto") -> "cn tower|toronto"
+    """
+    return "|".join(" ".join(str(p).casefold().split()) for p in parts)
+
+
+class SqliteCache:
+    """
+    Small persistent key -> JSON cache with a TTL per entry and an LRU size cap.
+    Safe to share between threads.
+    """
+
+    def __init__(
+        self,
+        table: str,
+        ttl_seconds: float,
+        max_entries: int,
+        path: Optional[str] = None,
+    ):
+        self.table = table
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.path = path or CACHE_PATH
+        self.hits = 0
+        self.misses = 0
+
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._conn.execute(
+                f"CREATE INDEX IF NOT EXISTS {table}_last_used ON {table}(last_used)"
+            )
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """
+        Returns (hit, value). Expired entries count as a miss and are removed.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return False, None
+
+            if row[1] <= now:
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self.misses += 1
+                return False, None
+
+            self._conn.execute(
+                f"UPDATE {self.table} SET last_used = ? WHERE key = ?", (now, key)
+            )
+            self.hits += 1
+            return True, json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        now = time.time()
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at, last_used) "
+                "VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now + ttl, now),
+            )
+            self._evict(now)
+
+    # SQLite may wait on the lock or its busy timeout: keep that off the event loop
+    async def aget(self, key: str) -> Tuple[bool, Any]:
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key: str, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        await asyncio.to_thread(self.set, key, value, ttl_seconds)
+
+    def _evict(self, now: float) -> None:
+        self._conn.execute(f"DELETE FROM {self.table} WHERE expires_at <= ?", (now,))
+        (count,) = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            # Least recently used entries go first
+            self._conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN ("
+                f"SELECT key FROM {self.table} ORDER BY last_used ASC LIMIT ?)",
+                (overflow,),
+            )
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(f"DELETE FROM {self.table}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            (size,) = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "size": size}
+
+
+# -------------------------
+# Geocoding cache (places_text_search)
+# -------------------------
+GEOCODE_TTL = float(os.getenv("GEOCODE_CACHE_TTL", str(30 * 24 * 3600)))
+# "No results found" is remembered for less time than a real hit
+GEOCODE_NEGATIVE_TTL = float(os.getenv("GEOCODE_NEGATIVE_TTL", str(24 * 3600)))
+GEOCODE_MAX_ENTRIES = int(os.getenv("GEOCODE_CACHE_MAX", "10000"))
+
+geocode_cache = SqliteCache("geocode", GEOCODE_TTL, GEOCODE_MAX_ENTRIES)
+
+
+# -------------------------
+# Hard-mode attraction names per city (generate_attractions)
+# -------------------------
+ATTRACTIONS_TTL = float(os.getenv("ATTRACTIONS_CACHE_TTL", str(7 * 24 * 3600)))
+ATTRACTIONS_MAX_ENTRIES = int(os.getenv("ATTRACTIONS_CACHE_MAX", "2000"))
+
+attractions_cache = SqliteCache("attractions", ATTRACTIONS_TTL, ATTRACTIONS_MAX_ENTRIES)
+
+
+# -------------------------
+# Latest {"trip", "plan"} per thread_id (incremental replanning)
+# -------------------------
+# Kept no longer than the forecasts inside it stay fresh
+PLAN_STORE_TTL = float(os.getenv("PLAN_STORE_TTL", "3600"))
+PLAN_STORE_MAX_ENTRIES = int(os.getenv("PLAN_STORE_MAX", "5000"))
+
+plan_store = SqliteCache("thread_plans", PLAN_STORE_TTL, PLAN_STORE_MAX_ENTRIES)
+
+
+# -------------------------
+# Spatio-temporal forecast cache (get_weather / get_air_quality)
+# -------------------------
+class ForecastCache:
+    """
+    In-memory cache for forecast responses keyed by a lat/lon grid cell plus a
+    forecast time bucket, so nearby lookups inside the same validity window
+    share one upstream response.
+
+    cell_deg:       grid size in degrees (0.01 deg is roughly 1.1 km)
+    bucket_seconds: width of the forecast time bucket
+    ttl_seconds:    max age of an entry, even inside its bucket
+    """
+
+    def __init__(
+        self,
+        cell_deg: float,
+        bucket_seconds: float,
+        ttl_seconds: float,
+        max_entries: int = 5000,
+    ):
+        self.cell_deg = cell_deg
+        self.bucket_seconds = bucket_seconds
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[tuple, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, lat: float, lon: float, *extra: Any) -> tuple:
+        cell = (round(lat / self.cell_deg), round(lon / self.cell_deg))
+        bucket = int(time.time() // self.bucket_seconds)
+        return (cell, bucket) + extra
+
+    def get(self, key: tuple) -> Tuple[bool, Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.time():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return False, None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[1]
+
+    def set(self, key: tuple, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+                "size": len(self._entries),
+                "cell_deg": self.cell_deg,
+            }
+
+
+FORECAST_CELL_DEG = float(os.getenv("FORECAST_CELL_DEG", "0.02"))
+
+weather_cache = ForecastCache(
+    cell_deg=FORECAST_CELL_DEG,
+    bucket_seconds=float(os.getenv("WEATHER_BUCKET_SECONDS", "3600")),
+    ttl_seconds=float(os.getenv("WEATHER_CACHE_TTL", "3600")),
+)
+air_cache = ForecastCache(
+    cell_deg=FORECAST_CELL_DEG,
+    bucket_seconds=float(os.getenv("AIR_BUCKET_SECONDS", "3600")),
+    ttl_seconds=float(os.getenv("AIR_CACHE_TTL", "3600")),
+)
+
+
+def forecast_cache_stats() -> dict:
+    """
+    Hit/miss counters for tuning FORECAST_CELL_DEG against accuracy.
+    """
+    return {"weather": weather_cache.stats(), "air_quality": air_cache.stats()}
+
+
+# -------------------------
+# Whole-plan cache (identical itineraries within one forecast bucket)
+# -------------------------
+PLAN_CACHE_TTL = float(os.getenv("PLAN_CACHE_TTL", "1800"))
+PLAN_CACHE_MAX_ENTRIES = int(os.getenv("PLAN_CACHE_MAX", "1000"))
+
+plan_cache = SqliteCache("plan_cache", PLAN_CACHE_TTL, PLAN_CACHE_MAX_ENTRIES)
+
+
+def plan_cache_key(trip: List[Dict[str, Any]]) -> str:
+    """
+    SHA-256 of the normalized parse_hard_input result (city, date, slot names and
+    times, case/whitespace-insensitive) plus the current weather forecast bucket,
+    so a cached plan never outlives the forecasts it was built from.
+    """
+    normalized = [
+        [
+            normalize_key(day["city"]),
+            day["date"],
+            [[normalize_key(s["name"]), normalize_key(s.get("time", ""))] for s in day.get("slots", [])],
+        ]
+        for day in trip
+    ]
+    bucket = int(time.time() // weather_cache.bucket_seconds)
+    payload = json.dumps([normalized, bucket], ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
@@ -0,0 +1,56 @@
+import os
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from cache import normalize_key
+
+# Tab-separated, sorted by city: city, name, address, lat, lon ("#" lines are comments).
+# Set ATTRACTION_CATALOG_PATH to another file, or to "" to always use the LLM + Places.
+CATALOG_PATH = os.getenv(
+    "ATTRACTION_CATALOG_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "attractions.tsv"),
+)
+
+# Other spellings of catalog cities
+CITY_ALIASES = {
+    "nyc": "new york",
+    "new york city": "new york",
+    "sf": "san francisco",
+    "roma": "rome",
+    "montréal": "montreal",
+}
+
+
+@lru_cache(maxsize=1)
+def _index(path: str) -> Dict[str, Tuple[Dict[str, Any], ...]]:
+    """
+    Read the catalog once into {normalized city: (place, ...)}.
+    """
+    index: Dict[str, List[Dict[str, Any]]] = {}
+    if not path or not os.path.exists(path):
+        return {}
+
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip() or line.startswith("#"):
+                continue
+            city, name, address, lat, lon = line.rstrip("\n").split("\t")
+            index.setdefault(normalize_key(city), []).append(
+                {"name": name, "address": address, "lat": float(lat), "lon": float(lon)}
+            )
+
+    return {city: tuple(places) for city, places in index.items()}
+
+
+def catalog_places(city: str) -> Optional[List[Dict[str, Any]]]:
+    """
+    Pre-geocoded attractions ({"name", "address", "lat", "lon"}) for a city,
+    or None when the city is not in the catalog.
+    """
+    key = normalize_key(city)
+    places = _index(CATALOG_PATH).get(CITY_ALIASES.get(key, key))
+    return [dict(p) for p in places] if places else None
+
+
+def catalog_cities() -> List[str]:
+    return sorted(_index(CATALOG_PATH))
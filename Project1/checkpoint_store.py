@@ -0,0 +1,453 @@
+import os
+import time
+import asyncio
+import random
+import sqlite3
+import threading
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.messages import HumanMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from langgraph.checkpoint.memory import MemorySaver
+
+from cache import CACHE_PATH
+
+# Which backend make_checkpointer() builds: "sqlite" (default) or "memory"
+CHECKPOINTER = os.getenv("CHECKPOINTER", "sqlite")
+CHECKPOINT_PATH = os.getenv(
+    "CHECKPOINT_PATH", os.path.join(os.path.dirname(CACHE_PATH), "checkpoints.sqlite")
+)
+# Per-thread caps on the stored conversation
+MAX_MESSAGES = int(os.getenv("CHECKPOINT_MAX_MESSAGES", "40"))
+MAX_BYTES = int(os.getenv("CHECKPOINT_MAX_BYTES", str(256 * 1024)))
+# Checkpoints kept per thread after compaction (older ones and their writes are dropped)
+KEEP_CHECKPOINTS = int(os.getenv("CHECKPOINT_KEEP", "2"))
+# Threads untouched for this long are deleted (0 disables)
+IDLE_TTL = float(os.getenv("CHECKPOINT_IDLE_TTL", str(7 * 24 * 3600)))
+
+
+def make_checkpointer(backend: Optional[str] = None) -> BaseCheckpointSaver:
+    """
+    Build the agent's checkpointer: "memory" (in-process, lost on restart)
+    or "sqlite" (bounded, persistent).
+    """
+    backend = backend or CHECKPOINTER
+    if backend == "memory":
+        return MemorySaver()
+    if backend == "sqlite":
+        return BoundedSqliteSaver(CHECKPOINT_PATH)
+    raise ValueError(f"Unknown checkpointer backend: {backend!r} (use 'sqlite' or 'memory')")
+
+
+class BoundedSqliteSaver(BaseCheckpointSaver[str]):
+    """
+    LangGraph checkpointer stored in SQLite with bounded per-thread state.
+
+    - every checkpoint keeps at most `max_messages` messages and `max_bytes` of
+      serialized messages (oldest turns are dropped, always restarting at a user
+      message so tool calls are never split from their results)
+    - only the latest `keep_checkpoints` checkpoints per thread are kept
+    - threads idle for more than `idle_ttl` seconds are evicted
+    """
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        max_messages: int = MAX_MESSAGES,
+        max_bytes: int = MAX_BYTES,
+        keep_checkpoints: int = KEEP_CHECKPOINTS,
+        idle_ttl: float = IDLE_TTL,
+        serde=None,
+    ):
+        super().__init__(serde=serde)
+        self.path = path
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.keep_checkpoints = max(1, keep_checkpoints)
+        self.idle_ttl = idle_ttl
+        self._last_idle_sweep = 0.0
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS checkpoints (
+                    thread_id TEXT NOT NULL,
+                    checkpoint_ns TEXT NOT NULL,
+                    checkpoint_id TEXT NOT NULL,
+                    parent_id TEXT,
+                    type TEXT NOT NULL,
+                    checkpoint BLOB NOT NULL,
+                    metadata_type TEXT NOT NULL,
+                    metadata BLOB NOT NULL,
+                    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+                );
+                CREATE TABLE IF NOT EXISTS writes (
+                    thread_id TEXT NOT NULL,
+                    checkpoint_ns TEXT NOT NULL,
+                    checkpoint_id TEXT NOT NULL,
+                    task_id TEXT NOT NULL,
+                    idx INTEGER NOT NULL,
+                    channel TEXT NOT NULL,
+                    type TEXT NOT NULL,
+                    value BLOB NOT NULL,
+                    task_path TEXT NOT NULL DEFAULT '',
+                    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+                );
+                CREATE TABLE IF NOT EXISTS threads (
+                    thread_id TEXT PRIMARY KEY,
+                    last_used REAL NOT NULL
+                );
+                """
+            )
+
+    # -------------------------
+    # Read
+    # -------------------------
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+
+        with self._lock:
+            if checkpoint_id:
+                row = self._conn.execute(
+                    "SELECT checkpoint_id, parent_id, type, checkpoint, metadata_type, metadata "
+                    "FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    (thread_id, checkpoint_ns, checkpoint_id),
+                ).fetchone()
+            else:
+                row = self._conn.execute(
+                    "SELECT checkpoint_id, parent_id, type, checkpoint, metadata_type, metadata "
+                    "FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+                    "ORDER BY checkpoint_id DESC LIMIT 1",
+                    (thread_id, checkpoint_ns),
+                ).fetchone()
+            if row is None:
+                return None
+            writes = self._load_writes(thread_id, checkpoint_ns, row[0])
+
+        return self._to_tuple(thread_id, checkpoint_ns, row, writes)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        query = (
+            "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_id, type, checkpoint, "
+            "metadata_type, metadata FROM checkpoints"
+        )
+        where, params = [], []
+        if config:
+            where.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if config["configurable"].get("checkpoint_ns") is not None:
+                where.append("checkpoint_ns = ?")
+                params.append(config["configurable"]["checkpoint_ns"])
+            if get_checkpoint_id(config):
+                where.append("checkpoint_id = ?")
+                params.append(get_checkpoint_id(config))
+        if before and get_checkpoint_id(before):
+            where.append("checkpoint_id < ?")
+            params.append(get_checkpoint_id(before))
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        query += " ORDER BY checkpoint_id DESC"
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+
+        for thread_id, checkpoint_ns, *row in rows:
+            metadata = self.serde.loads_typed((row[4], row[5]))
+            if filter and not all(metadata.get(k) == v for k, v in filter.items()):
+                continue
+            if limit is not None:
+                if limit <= 0:
+                    break
+                limit -= 1
+
+            with self._lock:
+                writes = self._load_writes(thread_id, checkpoint_ns, row[0])
+            yield self._to_tuple(thread_id, checkpoint_ns, row, writes)
+
+    def _load_writes(self, thread_id: str, checkpoint_ns: str, checkpoint_id: str):
+        return self._conn.execute(
+            "SELECT task_id, channel, type, value FROM writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? "
+            "ORDER BY task_path, task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+
+    def _to_tuple(self, thread_id: str, checkpoint_ns: str, row, writes) -> CheckpointTuple:
+        checkpoint_id, parent_id, type_, blob, metadata_type, metadata = row
+        return CheckpointTuple(
+            config={
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": checkpoint_id,
+                }
+            },
+            checkpoint=self.serde.loads_typed((type_, blob)),
+            metadata=self.serde.loads_typed((metadata_type, metadata)),
+            parent_config=(
+                {
+                    "configurable": {
+                        "thread_id": thread_id,
+                        "checkpoint_ns": checkpoint_ns,
+                        "checkpoint_id": parent_id,
+                    }
+                }
+                if parent_id
+                else None
+            ),
+            pending_writes=[
+                (task_id, channel, self.serde.loads_typed((t, v))) for task_id, channel, t, v in writes
+            ],
+        )
+
+    # -------------------------
+    # Write
+    # -------------------------
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+
+        checkpoint = self._bounded(checkpoint)
+        type_, blob = self.serde.dumps_typed(checkpoint)
+        metadata_type, metadata_blob = self.serde.dumps_typed(
+            get_checkpoint_metadata(config, metadata)
+        )
+
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    thread_id,
+                    checkpoint_ns,
+                    checkpoint["id"],
+                    config["configurable"].get("checkpoint_id"),
+                    type_,
+                    blob,
+                    metadata_type,
+                    metadata_blob,
+                ),
+            )
+            self._conn.execute("INSERT OR REPLACE INTO threads VALUES (?, ?)", (thread_id, now))
+            self._compact(thread_id, checkpoint_ns)
+
+            if self.idle_ttl and now - self._last_idle_sweep > 60:
+                self._last_idle_sweep = now
+                self._evict_idle(now - self.idle_ttl)
+
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            type_, blob = self.serde.dumps_typed(value)
+            rows.append(
+                (
+                    thread_id,
+                    checkpoint_ns,
+                    checkpoint_id,
+                    task_id,
+                    WRITES_IDX_MAP.get(channel, idx),
+                    channel,
+                    type_,
+                    blob,
+                    task_path,
+                )
+            )
+
+        with self._lock, self._conn:
+            for row in rows:
+                # Regular writes are idempotent; special ones (errors, interrupts) overwrite
+                verb = "INSERT OR IGNORE" if row[4] >= 0 else "INSERT OR REPLACE"
+                self._conn.execute(f"{verb} INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", row)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock, self._conn:
+            self._delete_threads([thread_id])
+
+    # -------------------------
+    # Bounding / compaction
+    # -------------------------
+    def _bounded(self, checkpoint: Checkpoint) -> Checkpoint:
+        messages = checkpoint.get("channel_values", {}).get("messages")
+        if not isinstance(messages, list) or not messages:
+            return checkpoint
+
+        trimmed = self.trim_messages(messages)
+        if len(trimmed) == len(messages):
+            return checkpoint
+
+        channel_values = {**checkpoint["channel_values"], "messages": trimmed}
+        return {**checkpoint, "channel_values": channel_values}
+
+    def trim_messages(self, messages: List[Any]) -> List[Any]:
+        """
+        Keep the newest messages within the count and byte caps, starting at a user turn.
+        """
+        start = max(0, len(messages) - self.max_messages)
+
+        total = 0
+        for i in range(len(messages) - 1, start - 1, -1):
+            total += len(self.serde.dumps_typed(messages[i])[1])
+            if total > self.max_bytes:
+                start = i + 1
+                break
+
+        # Never start mid-turn (e.g. on a ToolMessage whose tool call was dropped)
+        while start < len(messages) and start > 0 and not isinstance(messages[start], HumanMessage):
+            start += 1
+
+        if start >= len(messages):
+            # A single turn is over the cap: keep just its latest user message onwards
+            last_user = max(
+                (i for i, m in enumerate(messages) if isinstance(m, HumanMessage)), default=0
+            )
+            start = last_user
+
+        return messages[start:]
+
+    def _compact(self, thread_id: str, checkpoint_ns: str) -> None:
+        stale = self._conn.execute(
+            "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+            "ORDER BY checkpoint_id DESC LIMIT -1 OFFSET ?",
+            (thread_id, checkpoint_ns, self.keep_checkpoints),
+        ).fetchall()
+        for (checkpoint_id,) in stale:
+            for table in ("checkpoints", "writes"):
+                self._conn.execute(
+                    f"DELETE FROM {table} WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    (thread_id, checkpoint_ns, checkpoint_id),
+                )
+
+    def _evict_idle(self, cutoff: float) -> None:
+        idle = [
+            row[0]
+            for row in self._conn.execute(
+                "SELECT thread_id FROM threads WHERE last_used < ?", (cutoff,)
+            ).fetchall()
+        ]
+        self._delete_threads(idle)
+
+    def _delete_threads(self, thread_ids: List[str]) -> None:
+        for thread_id in thread_ids:
+            for table in ("checkpoints", "writes", "threads"):
+                self._conn.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+
+    def evict_idle_threads(self, max_idle_seconds: Optional[float] = None) -> None:
+        with self._lock, self._conn:
+            self._evict_idle(time.time() - (max_idle_seconds or self.idle_ttl))
+
+    def vacuum(self) -> None:
+        """
+        Give the space freed by trimming/eviction back to the filesystem.
+        """
+        with self._lock:
+            self._conn.execute("VACUUM")
+
+    def stats(self) -> dict:
+        with self._lock:
+            threads = self._conn.execute("SELECT COUNT(*) FROM threads").fetchone()[0]
+            checkpoints, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(checkpoint)), 0) FROM checkpoints"
+            ).fetchone()
+        return {"threads": threads, "checkpoints": checkpoints, "checkpoint_bytes": size}
+
+    # -------------------------
+    # Async API (each call may wait on the lock or SQLite's 30s busy timeout:
+    # run it in a worker thread so the event loop keeps serving other threads)
+    # -------------------------
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        items = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for item in items:
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+    def get_next_version(self, current: Optional[str], channel: None) -> str:
+        # Same monotonically increasing string versions as MemorySaver
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
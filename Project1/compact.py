@@ -0,0 +1,168 @@
+import os
+import json
+import threading
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+# Token budget for the PLAN_DATA part of the formatting prompt
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "1500"))
+TOKENIZER_MODEL = os.getenv("TOKENIZER_MODEL", "gpt-4o-mini")
+
+SLOT_FIELDS = ["time", "name", "address", "aqi", "mask"]
+MAX_ERROR_CHARS = 80
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    """
+    tiktoken encoding for the model, or None (not installed / BPE file not downloadable).
+    """
+    try:
+        import tiktoken
+
+        return tiktoken.encoding_for_model(TOKENIZER_MODEL)
+    except Exception:
+        return None
+
+
+def count_tokens(text: str) -> int:
+    enc = _encoding()
+    if enc is not None:
+        return len(enc.encode(text))
+    # ~4 characters per token for English/JSON
+    return (len(text) + 3) // 4
+
+
+def tokenizer_name() -> str:
+    return "tiktoken" if _encoding() is not None else "chars/4"
+
+
+# -------------------------
+# Plan -> compact PLAN_DATA
+# -------------------------
+def _error_text(value: Dict[str, Any]) -> str:
+    # Only the message: drop raw previews, HTTP details and URLs
+    return "unavailable: " + str(value.get("error"))[:MAX_ERROR_CHARS]
+
+
+def _weather_text(weather: Optional[Dict[str, Any]]) -> Optional[str]:
+    if not weather:
+        return None
+    if weather.get("error"):
+        return _error_text(weather)
+    parts = []
+    if weather.get("today_day"):
+        parts.append(f"{weather['today_day']} (day)")
+    if weather.get("today_night"):
+        parts.append(f"{weather['today_night']} (night)")
+    return " / ".join(parts) or None
+
+
+def _air_text(air: Optional[Dict[str, Any]]) -> Optional[str]:
+    if not air:
+        return None
+    if air.get("error"):
+        return _error_text(air)
+    if air.get("aqi") is None:
+        return air.get("category")
+    return f"AQI {air['aqi']} ({air['category']})" if air.get("category") else f"AQI {air['aqi']}"
+
+
+def _short_address(address: Optional[str]) -> Optional[str]:
+    if not address:
+        return address
+    return ", ".join(address.split(", ")[:2])
+
+
+def _slot_row(slot: Dict[str, Any], level: int) -> List[Any]:
+    if slot.get("error"):
+        address = "address not found"
+    elif level >= 2:
+        address = None
+    elif level == 1:
+        address = _short_address(slot.get("address"))
+    else:
+        address = slot.get("address")
+
+    row = [slot.get("time") or None, slot.get("name"), address, slot.get("aqi"), slot.get("mask_needed") or None]
+    # Trailing empty columns are left off
+    while row and row[-1] is None:
+        row.pop()
+    return row
+
+
+def _compact_day(day: Dict[str, Any], level: int) -> Dict[str, Any]:
+    out = {
+        "city": day.get("city"),
+        "date": day.get("date"),
+        "weather": _weather_text(day.get("weather")),
+        "air": _air_text(day.get("air_quality")),
+        "mask": bool(day.get("mask_needed_today")),
+        "slots": [_slot_row(s, level) for s in day.get("schedule") or []],
+    }
+    return {k: v for k, v in out.items() if v is not None}
+
+
+def encode_plan(plan: Dict[str, Any], level: int = 0) -> str:
+    """
+    PLAN_DATA as minified JSON: one object per day, slots as rows under a
+    single "slot_fields" header, weather/air as short strings, errors as one line.
+    Diagnostics (timings, replan counters, hourly AQ series, raw previews) are dropped.
+
+    level 1 shortens addresses to street + locality, level 2 drops them.
+    """
+    data = {
+        "total_masks": plan.get("total_masks", 0),
+        "slot_fields": SLOT_FIELDS,
+        "days": [_compact_day(d, level) for d in plan.get("days", [])],
+    }
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+_totals = {"prompts": 0, "raw_tokens": 0, "compact_tokens": 0, "over_budget": 0}
+_totals_lock = threading.Lock()
+
+
+def compact_plan(plan: Dict[str, Any], budget: Optional[int] = None) -> Tuple[str, Dict[str, Any]]:
+    """
+    Returns (PLAN_DATA text, report). Tries each compaction level until the text
+    fits `budget` tokens (PROMPT_TOKEN_BUDGET by default); days and slots are
+    never dropped, so a huge itinerary may still be over budget (report says so).
+    """
+    budget = budget or PROMPT_TOKEN_BUDGET
+
+    for level in range(3):
+        text = encode_plan(plan, level)
+        tokens = count_tokens(text)
+        if tokens <= budget:
+            break
+
+    # What the prompt used to contain: the plan dict's repr
+    raw_tokens = count_tokens(str(plan))
+    report = {
+        "tokenizer": tokenizer_name(),
+        "budget": budget,
+        "level": level,
+        "raw_tokens": raw_tokens,
+        "compact_tokens": tokens,
+        "tokens_saved": raw_tokens - tokens,
+        "over_budget": tokens > budget,
+    }
+
+    with _totals_lock:
+        _totals["prompts"] += 1
+        _totals["raw_tokens"] += raw_tokens
+        _totals["compact_tokens"] += tokens
+        _totals["over_budget"] += int(report["over_budget"])
+
+    return text, report
+
+
+def compaction_stats() -> Dict[str, Any]:
+    """
+    Totals over every compacted prompt in this process.
+    """
+    with _totals_lock:
+        totals = dict(_totals)
+    totals["tokens_saved"] = totals["raw_tokens"] - totals["compact_tokens"]
+    return totals
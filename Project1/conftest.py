@@ -0,0 +1,10 @@
+import os
+import tempfile
+
+# Loaded by pytest before any test module is collected, so every module that
+# reads these at import time (cache.py, checkpoint_store.py, ...) sees them.
+# Tests never touch the real caches, checkpoints or OpenAI.
+_TMP = tempfile.mkdtemp(prefix="travel-test-")
+os.environ["TRAVEL_CACHE_PATH"] = os.path.join(_TMP, "cache.sqlite")
+os.environ["CHECKPOINTER"] = "memory"
+os.environ.setdefault("OPENAI_API_KEY", "offline-test")
@@ -0,0 +1,143 @@
+import os
+import json
+from typing import Any, Dict, List, Optional
+
+from langchain_core.messages import AnyMessage, HumanMessage, RemoveMessage
+from langgraph.graph.message import REMOVE_ALL_MESSAGES
+from langchain.agents.middleware import AgentMiddleware, AgentState
+
+from compact import count_tokens
+
+# Max tokens of thread history sent to the model (rolling summary + latest turn)
+HISTORY_TOKEN_CEILING = int(os.getenv("HISTORY_TOKEN_CEILING", "2500"))
+# Earlier turns kept as summary lines (oldest are dropped first)
+HISTORY_SUMMARY_TURNS = int(os.getenv("HISTORY_SUMMARY_TURNS", "8"))
+# Attraction names listed per day in a summary line
+SUMMARY_MAX_PLACES = 4
+
+SUMMARY_SOURCE = "plan_history"
+SUMMARY_HEADER = "Summary of earlier turns in this conversation (latest plan is below):"
+# No PLAN_DATA turn was kept after the summary
+SUMMARY_HEADER_NO_PLAN = "Summary of earlier turns in this conversation:"
+
+
+def _is_summary(message: AnyMessage) -> bool:
+    return isinstance(message, HumanMessage) and message.additional_kwargs.get("lc_source") == SUMMARY_SOURCE
+
+
+def _text(message: AnyMessage) -> str:
+    content = message.content
+    if isinstance(content, str):
+        return content
+    return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+
+
+def _plan_data(text: str) -> Optional[Dict[str, Any]]:
+    _, marker, data = text.partition("PLAN_DATA:")
+    if not marker:
+        return None
+    try:
+        return json.loads(data.strip())
+    except ValueError:
+        return None
+
+
+def summarize_turn(messages: List[AnyMessage]) -> str:
+    """
+    One line for a finished turn: the cities/dates/places and mask total of
+    its PLAN_DATA, or the start of the user's message.
+    """
+    request = _text(messages[0])
+    plan = _plan_data(request)
+    if plan is None:
+        return "asked: " + " ".join(request.split())[:160]
+
+    days = []
+    for day in plan.get("days", []):
+        names = [row[1] for row in day.get("slots", []) if len(row) > 1 and row[1]]
+        shown = ", ".join(names[:SUMMARY_MAX_PLACES]) + (", ..." if len(names) > SUMMARY_MAX_PLACES else "")
+        days.append(f"{day.get('city')} {day.get('date')} ({shown})")
+    return f"plan: {'; '.join(days)}; TOTAL masks {plan.get('total_masks', 0)}"
+
+
+def _turns(messages: List[AnyMessage]) -> List[List[AnyMessage]]:
+    turns: List[List[AnyMessage]] = []
+    for m in messages:
+        if isinstance(m, HumanMessage) or not turns:
+            turns.append([m])
+        else:
+            turns[-1].append(m)
+    return turns
+
+
+def _latest_plan_turn(turns: List[List[AnyMessage]]) -> Optional[int]:
+    for i in range(len(turns) - 1, -1, -1):
+        if _plan_data(_text(turns[i][0])) is not None:
+            return i
+    return None
+
+
+def compact_history(messages: List[AnyMessage], ceiling: int = HISTORY_TOKEN_CEILING) -> Optional[List[AnyMessage]]:
+    """
+    Replace turns before the latest PLAN_DATA turn with lines in one rolling
+    summary message; that turn and every turn after it (follow-up questions and
+    their replies, tool calls) are kept as is. Without a PLAN_DATA turn only the
+    latest turn is kept.
+    Oldest summary lines are dropped beyond HISTORY_SUMMARY_TURNS lines or
+    `ceiling` tokens.
+    Returns None when there is nothing to compact.
+    """
+    lines: List[str] = []
+    rest = messages
+    if messages and _is_summary(messages[0]):
+        lines = _text(messages[0]).splitlines()[1:]
+        rest = messages[1:]
+
+    turns = _turns(rest)
+    plan_at = _latest_plan_turn(turns)
+    keep_from = len(turns) - 1 if plan_at is None else plan_at
+    if keep_from < 1:
+        return None
+
+    kept = [m for turn in turns[keep_from:] for m in turn]
+    for turn in turns[:keep_from]:
+        line = f"- {summarize_turn(turn)}"
+        # A re-sent, unchanged plan adds nothing new
+        if not lines or lines[-1] != line:
+            lines.append(line)
+    lines = lines[-HISTORY_SUMMARY_TURNS:]
+
+    header = SUMMARY_HEADER if plan_at is not None else SUMMARY_HEADER_NO_PLAN
+    budget = ceiling - sum(count_tokens(_text(m)) for m in kept) - count_tokens(header)
+    while lines and count_tokens("\n".join(lines)) > budget:
+        lines.pop(0)
+
+    if not lines:
+        return kept
+
+    summary = HumanMessage(
+        content="\n".join([header, *lines]),
+        additional_kwargs={"lc_source": SUMMARY_SOURCE},
+    )
+    return [summary, *kept]
+
+
+class PlanHistoryMiddleware(AgentMiddleware):
+    """
+    Keeps thread history flat: before each model call, earlier turns are folded
+    into a rolling plan summary (no extra LLM call), so turn 20 costs about the
+    same input tokens as turn 2. The rewrite is stored in the checkpoint too.
+    """
+
+    def __init__(self, ceiling: int = HISTORY_TOKEN_CEILING):
+        super().__init__()
+        self.ceiling = ceiling
+
+    def before_model(self, state: AgentState, runtime) -> Optional[Dict[str, Any]]:
+        compacted = compact_history(state["messages"], self.ceiling)
+        if compacted is None:
+            return None
+        return {"messages": [RemoveMessage(id=REMOVE_ALL_MESSAGES), *compacted]}
+
+    async def abefore_model(self, state: AgentState, runtime) -> Optional[Dict[str, Any]]:
+        return self.before_model(state, runtime)
@@ -0,0 +1,294 @@
+import os
+import time
+import asyncio
+import threading
+import weakref
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+import ratelimit
+import resilience
+from resilience import CircuitOpenError
+
+# Timeouts are (connect, read) in seconds
+CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "20"))
+# Keep-alive connections kept open per host
+POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+# Retries on 429/5xx (Retry-After is honoured) and on connection errors
+MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+BACKOFF_FACTOR = float(os.getenv("HTTP_BACKOFF_FACTOR", "0.5"))
+# Longest Retry-After we wait (or pause a rate-limit bucket) for; a bigger one is clamped to it
+RETRY_AFTER_MAX_SECONDS = float(os.getenv("HTTP_RETRY_AFTER_MAX_SECONDS", "30"))
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# What a tool treats as "API unavailable" rather than a bug
+UNAVAILABLE_ERRORS = (CircuitOpenError, requests.RequestException, httpx.TransportError)
+
+_sessions: Dict[str, requests.Session] = {}
+_lock = threading.Lock()
+
+
+def _new_session() -> requests.Session:
+    # Retries happen in _request, so every attempt is paced and counted
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=0)
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Accept-Encoding": "gzip, deflate"})
+    return session
+
+
+def session_for(url: str) -> requests.Session:
+    """
+    One pooled keep-alive session per host (maps, weather, airquality).
+    """
+    host = urlsplit(url).netloc
+    with _lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = _sessions[host] = _new_session()
+        return session
+
+
+def _throttled(bucket: Optional[ratelimit.TokenBucket], status: int, retry_after: Optional[float]) -> None:
+    # Still 429 after our retries: hold every caller of this API, not just this one
+    if bucket is not None and status == 429:
+        bucket.pause(retry_after if retry_after is not None else BACKOFF_FACTOR * (2 ** MAX_RETRIES))
+
+
+def _request(method: str, url: str, api: Optional[str], timeout, **kwargs) -> requests.Response:
+    ep = resilience.endpoint(api)
+    if ep is None:
+        return _request_with_retries(method, url, api, ep, timeout, **kwargs)[0]
+
+    ep.allow()
+    try:
+        response, wire_seconds = _request_with_retries(method, url, api, ep, timeout, **kwargs)
+    except requests.RequestException:
+        ep.record(False, 0.0)
+        raise
+    ep.record(response.status_code < 500, wire_seconds)
+    return response
+
+
+def _request_with_retries(method: str, url: str, api, ep, timeout, **kwargs) -> Tuple[requests.Response, float]:
+    """
+    Retries 429/5xx (honouring Retry-After) and connection errors / timeouts.
+    The Air Quality lookup is a read-only POST, so POSTs are retried too.
+    Returns the response and the slowest attempt's time on the wire (quota waits
+    and backoff sleeps excluded), which is what the circuit breaker judges.
+    """
+    session = session_for(url)
+    bucket = ratelimit.bucket(api)
+    slowest = 0.0
+
+    def take_token() -> None:
+        if bucket is not None:
+            bucket.acquire()
+        if api:
+            metrics.count_request(api)
+
+    def send() -> Tuple[requests.Response, float]:
+        sent = time.monotonic()
+        response = session.request(method, url, timeout=timeout or (CONNECT_TIMEOUT, READ_TIMEOUT), **kwargs)
+        seconds = time.monotonic() - sent
+        if ep is not None:
+            ep.observe(seconds)
+        return response, seconds
+
+    for attempt in range(MAX_RETRIES + 1):
+        last_attempt = attempt == MAX_RETRIES
+        try:
+            response, seconds = resilience.hedged(ep, send, take_token)
+        except (requests.ConnectionError, requests.Timeout):
+            if last_attempt:
+                raise
+            time.sleep(BACKOFF_FACTOR * (2 ** attempt))
+            continue
+        slowest = max(slowest, seconds)
+
+        delay = _retry_after_seconds(response)
+        if response.status_code not in RETRY_STATUSES:
+            return response, slowest
+        if last_attempt:
+            _throttled(bucket, response.status_code, delay)
+            return response, slowest
+        if bucket is not None and response.status_code == 429:
+            # The next attempt waits on the bucket, so every other caller backs off too
+            bucket.pause(delay if delay is not None else BACKOFF_FACTOR * (2 ** attempt))
+            continue
+
+        time.sleep(delay if delay is not None else BACKOFF_FACTOR * (2 ** attempt))
+
+
+def get(
+    url: str,
+    params: Optional[Dict[str, Any]] = None,
+    timeout=None,
+    api: Optional[str] = None,
+) -> requests.Response:
+    """
+    api ("places" / "weather" / "air_quality") paces the call on that API's token
+    bucket and guards it with that API's circuit breaker (CircuitOpenError while
+    open) and optional hedging (resilience.py).
+    """
+    return _request("GET", url, api, timeout, params=params)
+
+
+def post(
+    url: str,
+    params: Optional[Dict[str, Any]] = None,
+    json: Any = None,
+    timeout=None,
+    api: Optional[str] = None,
+) -> requests.Response:
+    return _request("POST", url, api, timeout, params=params, json=json)
+
+
+def close_all() -> None:
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+# -------------------------
+# Async client (httpx) with the same pooling / retry policy
+# -------------------------
+# httpx clients are bound to the event loop that created them
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def async_client() -> httpx.AsyncClient:
+    """
+    Shared AsyncClient for the running event loop (HTTP/1.1 keep-alive per host).
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_keepalive_connections=POOL_SIZE, max_connections=POOL_SIZE * 4),
+            headers={"Accept-Encoding": "gzip, deflate"},
+        )
+        _async_clients[loop] = client
+    return client
+
+
+def _retry_after_seconds(response) -> Optional[float]:
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    # A misbehaving server must not park every caller of the API for hours
+    return min(max(0.0, seconds), RETRY_AFTER_MAX_SECONDS)
+
+
+async def _arequest(method: str, url: str, api: Optional[str] = None, **kwargs) -> httpx.Response:
+    ep = resilience.endpoint(api)
+    if ep is None:
+        return (await _arequest_with_retries(method, url, api, ep, **kwargs))[0]
+
+    ep.allow()
+    try:
+        response, wire_seconds = await _arequest_with_retries(method, url, api, ep, **kwargs)
+    except httpx.TransportError:
+        ep.record(False, 0.0)
+        raise
+    ep.record(response.status_code < 500, wire_seconds)
+    return response
+
+
+async def _arequest_with_retries(method: str, url: str, api, ep, **kwargs) -> Tuple[httpx.Response, float]:
+    client = async_client()
+    bucket = ratelimit.bucket(api)
+    slowest = 0.0
+
+    async def take_token() -> None:
+        if bucket is not None:
+            await bucket.aacquire()
+        if api:
+            metrics.count_request(api)
+
+    async def send() -> Tuple[httpx.Response, float]:
+        sent = time.monotonic()
+        response = await client.request(method, url, **kwargs)
+        seconds = time.monotonic() - sent
+        if ep is not None:
+            ep.observe(seconds)
+        return response, seconds
+
+    for attempt in range(MAX_RETRIES + 1):
+        last_attempt = attempt == MAX_RETRIES
+        try:
+            response, seconds = await resilience.ahedged(ep, send, take_token)
+        except httpx.TransportError:
+            if last_attempt:
+                raise
+            await asyncio.sleep(BACKOFF_FACTOR * (2 ** attempt))
+            continue
+        slowest = max(slowest, seconds)
+
+        delay = _retry_after_seconds(response)
+        if response.status_code not in RETRY_STATUSES:
+            return response, slowest
+        if last_attempt:
+            _throttled(bucket, response.status_code, delay)
+            return response, slowest
+        if bucket is not None and response.status_code == 429:
+            # The next attempt waits on the bucket, so every other caller backs off too
+            bucket.pause(delay if delay is not None else BACKOFF_FACTOR * (2 ** attempt))
+            continue
+
+        await asyncio.sleep(delay if delay is not None else BACKOFF_FACTOR * (2 ** attempt))
+
+
+async def aget(
+    url: str,
+    params: Optional[Dict[str, Any]] = None,
+    timeout=None,
+    api: Optional[str] = None,
+) -> httpx.Response:
+    kwargs = {"params": params}
+    if timeout is not None:
+        kwargs["timeout"] = timeout
+    return await _arequest("GET", url, api=api, **kwargs)
+
+
+async def apost(
+    url: str,
+    params: Optional[Dict[str, Any]] = None,
+    json: Any = None,
+    timeout=None,
+    api: Optional[str] = None,
+) -> httpx.Response:
+    kwargs = {"params": params, "json": json}
+    if timeout is not None:
+        kwargs["timeout"] = timeout
+    return await _arequest("POST", url, api=api, **kwargs)
+
+
+async def aclose_all() -> None:
+    """
+    Close the AsyncClient of the running event loop (call before the loop exits).
+    """
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
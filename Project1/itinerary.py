@@ -0,0 +1,226 @@
+import re
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# "City1:" starts a day (anywhere on a line, like the old re.split)
+HEADER_RE = re.compile(r"City\d+\s*:")
+# "<city> <YYYY-MM-DD>": the city may be several words
+CITY_DATE_RE = re.compile(r"\s*(?P<city>\S.*?)\s+(?P<date>\d{4}-\d{2}-\d{2})(?!\S)")
+
+# "8am-9am", "9:00 AM – 10:30 AM", "14:00-15:30", "3pm"
+_AMPM = r"[aApP]\.?[mM]\.?"
+_CLOCK = rf"\d{{1,2}}(?::\d{{2}})?(?:\s*{_AMPM})?"
+TIME = rf"{_CLOCK}(?:\s*[-–—]\s*{_CLOCK})?"
+# The start of "9am-10am": after the first word of a place name it means a lost ";"
+_RANGE_START = rf"\d{{1,2}}(?::\d{{2}})?\s*{_AMPM}\s*[-–—]\s*\d"
+
+# "<place>;<time>" followed by whitespace or the end of the line (leading spaces skipped).
+# No word of the place after the first may start a time range.
+SLOT_RE = re.compile(
+    rf"\s*(?P<name>[^;\s]+(?:\s+(?!{_RANGE_START})[^;\s]+)*)"
+    rf"\s*;\s*(?P<time>{TIME})(?!\S)"
+)
+# Any place name: matches where SLOT_RE does not only if a ";" is missing inside the name
+_LOOSE_SLOT = rf"\s*(?P<name>[^;\s](?:[^;]*[^;\s])?)\s*;\s*(?P<time>{TIME})(?!\S)"
+LOOSE_SLOT_RE = re.compile(_LOOSE_SLOT)
+# A word starting a time range: on a line without one, both slot regexes read the same slots
+RANGE_WORD_RE = re.compile(rf"\s{_RANGE_START}")
+# findall() gives (name, time, "") per slot; from the first offset that is not a slot, the
+# rest of the line is one ("", "", rest) item, so no later offset is ever retried
+SLOTS_RE = re.compile(rf"{_LOOSE_SLOT}|(?P<rest>[\s\S]+)")
+# "City1: <city> <date>" opening a line
+DAY_START_RE = re.compile(r"\s*City\d+\s*:\s*(?P<city>\S.*?)\s+(?P<date>\d{4}-\d{2}-\d{2})(?!\S)")
+SPACE_RE = re.compile(r"\s*")
+NON_SPACE_RE = re.compile(r"\S*")
+
+# (text, start, end, line number) of one line, so a whole text is parsed in place
+Row = Tuple[str, int, int, int]
+
+
+class ItinerarySyntaxError(ValueError):
+    def __init__(self, message: str, line: int, column: int):
+        super().__init__(f"line {line}, column {column}: {message}")
+        self.message = message
+        self.line = line
+        self.column = column
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"line": self.line, "column": self.column, "message": self.message}
+
+
+class _DayParser:
+    """
+    Single pass over the lines of a hard-mode itinerary with precompiled regexes.
+    A well-formed day line is read with one match(), one search() and one findall(),
+    all linear in the line; any other line is walked token by token (pos/endpos)
+    to locate its problems.
+    """
+
+    def __init__(self, errors: Optional[List[ItinerarySyntaxError]]):
+        self.errors = errors
+        self.day: Optional[Dict[str, Any]] = None
+        # Header seen, city/date not yet: (line, column)
+        self.header_at: Optional[Tuple[int, int]] = None
+        # The current day's header was bad: ignore its text until the next header
+        self.skipping = False
+        # Offset of the current line's first character in its text
+        self.line_start = 0
+
+    def error(self, message: str, line_no: int, pos: int) -> None:
+        self.report(message, line_no, pos - self.line_start + 1)
+
+    def report(self, message: str, line_no: int, column: int) -> None:
+        err = ItinerarySyntaxError(message, line_no, column)
+        if self.errors is None:
+            raise err
+        self.errors.append(err)
+
+    def clean_day(self, text: str, start: int, end: int) -> Optional[Dict[str, Any]]:
+        """
+        The day on this line if the line is exactly one well-formed day, else None.
+        """
+        m = DAY_START_RE.match(text, start, end)
+        # A second header would be read as part of the city or a place name
+        if m is None or HEADER_RE.search(text, m.start("city"), end):
+            return None
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        pos = m.end()
+        # A possibly missing ";" (or a time after "; ") is left to feed() to judge
+        if RANGE_WORD_RE.search(text, pos, end):
+            return None
+        found = SLOTS_RE.findall(text, pos, end)
+        if found and found[-1][2]:
+            return None
+        return {
+            "city": m.group("city"),
+            "date": m.group("date"),
+            "slots": [{"name": name, "time": time} for name, time, _ in found],
+        }
+
+    def start_day(self, day: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        if self.day is not None or self.header_at is not None:
+            yield from self.finish()
+        self.day = day
+        self.skipping = False
+
+    def feed(self, text: str, line_no: int, start: int, end: int) -> Iterator[Dict[str, Any]]:
+        self.line_start = start
+        while end > start and text[end - 1] in "\r\n":
+            end -= 1
+        pos = start
+        for header in HEADER_RE.finditer(text, start, end):
+            self.segment(text, line_no, pos, header.start())
+            yield from self.finish()
+            self.header_at = (line_no, header.start() - start + 1)
+            self.skipping = False
+            pos = header.end()
+        self.segment(text, line_no, pos, end)
+
+    def finish(self) -> Iterator[Dict[str, Any]]:
+        if self.header_at is not None:
+            self.report("expected '<city> <YYYY-MM-DD>' after the day header", *self.header_at)
+            self.header_at = None
+        if self.day is not None:
+            yield self.day
+            self.day = None
+
+    def segment(self, text: str, line_no: int, pos: int, end: int) -> None:
+        pos = SPACE_RE.match(text, pos, end).end()
+        if pos >= end or self.skipping:
+            return
+
+        if self.header_at is not None:
+            m = CITY_DATE_RE.match(text, pos, end)
+            self.header_at = None
+            if m is None:
+                self.skipping = True
+                self.error("expected '<city> <YYYY-MM-DD>' after the day header", line_no, pos)
+                return
+            self.day = {"city": m.group("city"), "date": m.group("date"), "slots": []}
+            pos = SPACE_RE.match(text, m.end(), end).end()
+        elif self.day is None:
+            self.error("text before the first 'City1:' header", line_no, pos)
+            return
+
+        slots = self.day["slots"]
+        while pos < end:
+            m = SLOT_RE.match(text, pos, end)
+            if m is not None:
+                slots.append({"name": m.group("name"), "time": m.group("time")})
+                pos = m.end()
+            else:
+                loose = LOOSE_SLOT_RE.match(text, pos, end)
+                if loose is not None:
+                    self.error(f"missing ';' between place and time in '{loose.group('name')}'", line_no, pos)
+                    pos = loose.end()
+                else:
+                    pos = self.bad_slot(text, line_no, pos, end)
+            pos = SPACE_RE.match(text, pos, end).end()
+
+    def bad_slot(self, text: str, line_no: int, pos: int, end: int) -> int:
+        semicolon = text.find(";", pos, end)
+        if semicolon < 0:
+            self.error("expected '<place>;<time>'", line_no, pos)
+            return end
+        time_at = SPACE_RE.match(text, semicolon + 1, end).end()
+        if semicolon == pos:
+            self.error("missing place name before ';'", line_no, pos)
+        else:
+            self.error("expected a time like 8am-9am after ';'", line_no, time_at)
+        # Skip the bad time and resume at the next place
+        return NON_SPACE_RE.match(text, time_at, end).end()
+
+
+def _days(rows: Iterable[Row], errors: Optional[List[ItinerarySyntaxError]]) -> Iterator[Dict[str, Any]]:
+    parser = _DayParser(errors)
+    clean_day = parser.clean_day
+    for text, start, end, line_no in rows:
+        day = clean_day(text, start, end)
+        if day is not None:
+            yield from parser.start_day(day)
+        else:
+            yield from parser.feed(text, line_no, start, end)
+    yield from parser.finish()
+
+
+def _text_rows(text: str, first_line: int) -> Iterator[Row]:
+    # Line boundaries only: the lines are never copied out of the text
+    start, size, line_no = 0, len(text), first_line
+    while start < size:
+        end = text.find("\n", start)
+        if end < 0:
+            end = size
+        yield text, start, end, line_no
+        start, line_no = end + 1, line_no + 1
+
+
+def iter_days(
+    lines: Iterable[str],
+    errors: Optional[List[ItinerarySyntaxError]] = None,
+    first_line: int = 1,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Parse hard-mode itinerary lines (a file object works) into days
+    {"city", "date", "slots": [{"name", "time"}]}, yielding each day once the
+    next header or the end of input is reached, so large files stream.
+
+    With errors=None the first problem raises ItinerarySyntaxError (line/column,
+    counting lines from first_line); with a list, problems are appended there and
+    the bad slot or day is skipped.
+    """
+    return _days(((line, 0, len(line), n) for n, line in enumerate(lines, first_line)), errors)
+
+
+def iter_text_days(
+    text: str,
+    errors: Optional[List[ItinerarySyntaxError]] = None,
+    first_line: int = 1,
+) -> Iterator[Dict[str, Any]]:
+    """
+    iter_days over an in-memory text, parsed in place line by line.
+    """
+    return _days(_text_rows(text, first_line), errors)
+
+
+def parse_itinerary(text: str, errors: Optional[List[ItinerarySyntaxError]] = None) -> List[Dict[str, Any]]:
+    return list(iter_text_days(text, errors))
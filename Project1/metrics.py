@@ -0,0 +1,292 @@
+import json
+import time
+import asyncio
+import threading
+import functools
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+# Latency histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0)
+
+
+class CallStats:
+    """
+    Count, errors, latency histogram, response bytes and (LLM calls) tokens for
+    one tool / LLM call site.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.bytes = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)  # last one is +Inf
+
+    def add(self, seconds: float, error: bool, nbytes: int, input_tokens: int = 0, output_tokens: int = 0) -> None:
+        self.count += 1
+        self.errors += int(error)
+        self.seconds += seconds
+        self.bytes += nbytes
+        self.input_tokens += input_tokens
+        self.output_tokens += output_tokens
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+
+    def as_dict(self) -> Dict[str, Any]:
+        tokens = {"input_tokens": self.input_tokens, "output_tokens": self.output_tokens}
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "error_rate": round(self.errors / self.count, 4) if self.count else 0.0,
+            "seconds": round(self.seconds, 4),
+            "mean_ms": round(self.seconds / self.count * 1000, 2) if self.count else 0.0,
+            "bytes": self.bytes,
+            **(tokens if self.input_tokens or self.output_tokens else {}),
+            "latency_buckets": {
+                **{str(b): n for b, n in zip(LATENCY_BUCKETS, self.buckets)},
+                "+Inf": self.buckets[-1],
+            },
+        }
+
+
+class Registry:
+    """
+    Process-wide totals per call site (thread-safe).
+    """
+
+    def __init__(self):
+        self._stats: Dict[str, CallStats] = {}
+        self._requests: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(
+        self, name: str, seconds: float, error: bool = False, nbytes: int = 0,
+        input_tokens: int = 0, output_tokens: int = 0,
+    ) -> None:
+        with self._lock:
+            self._stats.setdefault(name, CallStats()).add(seconds, error, nbytes, input_tokens, output_tokens)
+
+    def count_request(self, api: str) -> None:
+        with self._lock:
+            self._requests[api] = self._requests.get(api, 0) + 1
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+            self._requests.clear()
+
+    def to_json(self) -> Dict[str, Any]:
+        with self._lock:
+            return {name: stats.as_dict() for name, stats in sorted(self._stats.items())}
+
+    def api_requests(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(sorted(self._requests.items()))
+
+    def to_prometheus(self) -> str:
+        with self._lock:
+            items = [(f'call="{name}"', s) for name, s in sorted(self._stats.items())]
+            lines = []
+
+            for metric, help_text, attr in (
+                ("travel_calls_total", "Tool and LLM calls.", "count"),
+                ("travel_call_errors_total", "Tool and LLM calls that failed or returned an error.", "errors"),
+                ("travel_call_response_bytes_total", "Bytes returned by tool and LLM calls.", "bytes"),
+            ):
+                lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+                lines += [f"{metric}{{{label}}} {getattr(s, attr)}" for label, s in items]
+
+            llm_items = [(label, s) for label, s in items if s.input_tokens or s.output_tokens]
+            if llm_items:
+                lines += ["# HELP travel_llm_tokens_total LLM prompt (input) and completion (output) tokens.",
+                          "# TYPE travel_llm_tokens_total counter"]
+                for label, s in llm_items:
+                    lines.append(f'travel_llm_tokens_total{{{label},kind="input"}} {s.input_tokens}')
+                    lines.append(f'travel_llm_tokens_total{{{label},kind="output"}} {s.output_tokens}')
+
+            if self._requests:
+                lines += ["# HELP travel_api_requests_total HTTP requests sent to each Google API (incl. retries/hedges).",
+                          "# TYPE travel_api_requests_total counter"]
+                lines += [f'travel_api_requests_total{{api="{api}"}} {n}' for api, n in sorted(self._requests.items())]
+
+            lines += [
+                "# HELP travel_call_latency_seconds Tool and LLM call latency.",
+                "# TYPE travel_call_latency_seconds histogram",
+            ]
+            for label, s in items:
+                cumulative = 0
+                for bound, n in zip(LATENCY_BUCKETS, s.buckets):
+                    cumulative += n
+                    lines.append(f'travel_call_latency_seconds_bucket{{{label},le="{bound}"}} {cumulative}')
+                lines.append(f'travel_call_latency_seconds_bucket{{{label},le="+Inf"}} {s.count}')
+                lines.append(f"travel_call_latency_seconds_sum{{{label}}} {s.seconds:.6f}")
+                lines.append(f"travel_call_latency_seconds_count{{{label}}} {s.count}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+# -------------------------
+# Per-run breakdown (attached to build_plan output)
+# -------------------------
+class RunTimings:
+    def __init__(self, parent: Optional["RunTimings"] = None):
+        self.started = time.perf_counter()
+        # The enclosing run (e.g. run_agent around build_plan) also sees every call
+        self.parent = parent
+        self._calls: Dict[str, Dict[str, Any]] = {}
+        self._requests: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def add(
+        self, name: str, seconds: float, error: bool, nbytes: int,
+        input_tokens: int = 0, output_tokens: int = 0,
+    ) -> None:
+        with self._lock:
+            c = self._calls.setdefault(name, {"calls": 0, "errors": 0, "seconds": 0.0, "bytes": 0})
+            c["calls"] += 1
+            c["errors"] += int(error)
+            c["seconds"] += seconds
+            c["bytes"] += nbytes
+            if input_tokens or output_tokens:
+                c["input_tokens"] = c.get("input_tokens", 0) + input_tokens
+                c["output_tokens"] = c.get("output_tokens", 0) + output_tokens
+
+    def count_request(self, api: str) -> None:
+        with self._lock:
+            self._requests[api] = self._requests.get(api, 0) + 1
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        {"wall_seconds", "calls": {name: {calls, errors, seconds, bytes[, input/output_tokens]}},
+        "api_requests": {api: HTTP requests sent}}
+        """
+        with self._lock:
+            calls = {
+                name: {**c, "seconds": round(c["seconds"], 4)} for name, c in sorted(self._calls.items())
+            }
+            requests = dict(sorted(self._requests.items()))
+        return {
+            "wall_seconds": round(time.perf_counter() - self.started, 4),
+            "calls": calls,
+            "api_requests": requests,
+        }
+
+
+_current_run: contextvars.ContextVar[Optional[RunTimings]] = contextvars.ContextVar(
+    "travel_current_run", default=None
+)
+
+
+@contextmanager
+def run_timer() -> Iterator[RunTimings]:
+    """
+    Collect every instrumented call made inside this block (including from
+    threads started with submit_in_context) into one RunTimings.
+    """
+    run = RunTimings(parent=_current_run.get())
+    token = _current_run.set(run)
+    try:
+        yield run
+    finally:
+        _current_run.reset(token)
+
+
+def submit_in_context(pool, fn: Callable, *args, **kwargs):
+    """
+    pool.submit that carries the caller's context (and so its run timer) into the worker thread.
+    """
+    return pool.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def record(
+    name: str, seconds: float, error: bool = False, nbytes: int = 0,
+    input_tokens: int = 0, output_tokens: int = 0,
+) -> None:
+    registry.record(name, seconds, error, nbytes, input_tokens, output_tokens)
+    run = _current_run.get()
+    while run is not None:
+        run.add(name, seconds, error, nbytes, input_tokens, output_tokens)
+        run = run.parent
+
+
+def count_request(api: str) -> None:
+    """
+    One HTTP request actually sent to a Google API (cache hits never get here).
+    """
+    registry.count_request(api)
+    run = _current_run.get()
+    while run is not None:
+        run.count_request(api)
+        run = run.parent
+
+
+def _result_info(result: Any):
+    error = isinstance(result, dict) and bool(result.get("error"))
+    try:
+        nbytes = len(json.dumps(result, default=str))
+    except (TypeError, ValueError):
+        nbytes = 0
+    return error, nbytes
+
+
+def instrument(name: str):
+    """
+    Decorator recording count, latency, errors (exception or {"error": ...}
+    result) and result size for a sync or async function.
+    """
+
+    def decorate(fn):
+        if asyncio.iscoroutinefunction(fn):
+
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                t0 = time.perf_counter()
+                try:
+                    result = await fn(*args, **kwargs)
+                except Exception:
+                    record(name, time.perf_counter() - t0, error=True)
+                    raise
+                record(name, time.perf_counter() - t0, *_result_info(result))
+                return result
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception:
+                record(name, time.perf_counter() - t0, error=True)
+                raise
+            record(name, time.perf_counter() - t0, *_result_info(result))
+            return result
+
+        return wrapper
+
+    return decorate
+
+
+@contextmanager
+def timed(name: str) -> Iterator[Dict[str, Any]]:
+    """
+    Time a block (e.g. an LLM call). Set info["bytes"] / info["error"] inside the block.
+    """
+    info: Dict[str, Any] = {"bytes": 0, "error": False}
+    t0 = time.perf_counter()
+    try:
+        yield info
+    except Exception:
+        record(name, time.perf_counter() - t0, error=True, nbytes=info["bytes"])
+        raise
+    record(name, time.perf_counter() - t0, error=info["error"], nbytes=info["bytes"])
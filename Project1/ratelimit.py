@@ -0,0 +1,164 @@
+import os
+import time
+import asyncio
+import threading
+from typing import Any, Dict, Optional
+
+# Per-API quotas in requests/second (0 disables pacing for that API).
+# Set these to the project's Google Cloud quota (per-minute quota / 60).
+PLACES_QPS = float(os.getenv("PLACES_QPS", "10"))
+WEATHER_QPS = float(os.getenv("WEATHER_QPS", "50"))
+AIR_QUALITY_QPS = float(os.getenv("AIR_QUALITY_QPS", "50"))
+# Pace this fraction under the quota so clock skew / retries do not tip us into 429s
+RATE_LIMIT_HEADROOM = float(os.getenv("RATE_LIMIT_HEADROOM", "0.05"))
+# Seconds of unused budget that may be spent at once (kept small: quotas are per minute,
+# but bursts are what the backend sees first)
+RATE_LIMIT_BURST_SECONDS = float(os.getenv("RATE_LIMIT_BURST_SECONDS", "0.1"))
+# ... but never fewer requests than the process sends at once (one per pooled
+# connection), so pacing does not serialize a concurrent plan that is well within quota
+RATE_LIMIT_MIN_BURST = float(os.getenv("RATE_LIMIT_MIN_BURST", os.getenv("HTTP_POOL_SIZE", "16")))
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket shared by sync (threads) and async callers.
+
+    Each call reserves the next free send time under a lock and then sleeps
+    outside it, so callers are served in arrival order and never send faster
+    than `rate` per second once the `burst` tokens of unused budget are spent.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        qps: float,
+        headroom: float = RATE_LIMIT_HEADROOM,
+        burst_seconds: float = RATE_LIMIT_BURST_SECONDS,
+        min_burst: float = RATE_LIMIT_MIN_BURST,
+    ):
+        self.name = name
+        self.qps = qps
+        self.rate = qps * (1 - headroom) if qps > 0 else 0.0
+        self.burst = max(1.0, min_burst, self.rate * burst_seconds) if self.rate else 0.0
+
+        self._lock = threading.Lock()
+        self._tokens = self.burst
+        # Time tokens were last counted; in the future while paused after a 429
+        self._updated = time.monotonic()
+
+        self.requests = 0
+        self.waited = 0
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.throttled = 0
+
+    def _reserve(self) -> float:
+        """
+        Take one token (possibly borrowing against the future); return seconds to wait.
+        """
+        with self._lock:
+            self.requests += 1
+            if not self.rate:
+                return 0.0
+
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= 1
+
+            wait = max(0.0, self._updated - now) + max(0.0, -self._tokens / self.rate)
+            if wait > 0:
+                self.waited += 1
+                self.queue_depth += 1
+                self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+            return wait
+
+    def _refill(self, now: float) -> None:
+        if now > self._updated:
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+    def _done_waiting(self) -> None:
+        with self._lock:
+            self.queue_depth -= 1
+
+    def acquire(self) -> float:
+        wait = self._reserve()
+        if wait > 0:
+            try:
+                time.sleep(wait)
+            finally:
+                self._done_waiting()
+        return wait
+
+    async def aacquire(self) -> float:
+        wait = self._reserve()
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                self._done_waiting()
+        return wait
+
+    def pause(self, seconds: float) -> None:
+        """
+        Hold new callers for `seconds` (e.g. after a 429 with Retry-After), then
+        resume at the paced rate without a burst.
+        """
+        with self._lock:
+            self.throttled += 1
+            if not self.rate:
+                return
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens = min(self._tokens, 0.0)
+            self._updated = max(self._updated, now + seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "qps": self.qps,
+                "paced_qps": round(self.rate, 3),
+                "requests": self.requests,
+                "waited": self.waited,
+                "queue_depth": self.queue_depth,
+                "max_queue_depth": self.max_queue_depth,
+                "total_wait_s": round(self.total_wait, 3),
+                "mean_wait_ms": round(self.total_wait / self.waited * 1000, 1) if self.waited else 0.0,
+                "max_wait_ms": round(self.max_wait * 1000, 1),
+                "throttled": self.throttled,
+            }
+
+
+buckets: Dict[str, TokenBucket] = {
+    "places": TokenBucket("places", PLACES_QPS),
+    "weather": TokenBucket("weather", WEATHER_QPS),
+    "air_quality": TokenBucket("air_quality", AIR_QUALITY_QPS),
+}
+
+
+def bucket(api: Optional[str]) -> Optional[TokenBucket]:
+    return buckets.get(api) if api else None
+
+
+def stats() -> Dict[str, Dict[str, Any]]:
+    """
+    Queue depth and wait time per API budget.
+    """
+    return {name: b.stats() for name, b in buckets.items()}
+
+
+def format_stats() -> str:
+    lines = []
+    for name, s in stats().items():
+        if not s["requests"]:
+            continue
+        lines.append(
+            f"{name:>11}: {s['requests']} requests at <= {s['paced_qps']}/s  "
+            f"waited {s['waited']} (mean {s['mean_wait_ms']}ms, max {s['max_wait_ms']}ms)  "
+            f"max queue {s['max_queue_depth']}  429s {s['throttled']}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,83 @@
+from typing import Any, Dict, List, Optional
+
+
+# -------------------------
+# Local plan renderer (no LLM call)
+# -------------------------
+def render_plan(plan: Dict[str, Any]) -> str:
+    """
+    Format build_plan output as a readable itinerary:
+    TOTAL masks first, then per city/date weather, air quality, mask flag and schedule.
+    """
+    lines: List[str] = [f"TOTAL masks needed: {plan.get('total_masks', 0)}", ""]
+
+    for day in plan.get("days", []):
+        lines.extend(render_day(day))
+        lines.append("")
+
+    return "\n".join(lines).rstrip() + "\n"
+
+
+def render_day(day: Dict[str, Any]) -> List[str]:
+    lines = [
+        f"{day.get('city')} — {day.get('date')}",
+        f"  Weather: {_weather_text(day.get('weather'))}",
+        f"  Air quality: {_air_text(day.get('air_quality'))}",
+        f"  Mask needed today: {'Yes' if day.get('mask_needed_today') else 'No'}",
+        "  Schedule:",
+    ]
+
+    schedule = day.get("schedule") or []
+    if not schedule:
+        lines.append("    (no places)")
+
+    for slot in schedule:
+        lines.append(f"    - {_slot_text(slot)}")
+
+    return lines
+
+
+def _weather_text(weather: Optional[Dict[str, Any]]) -> str:
+    if not weather:
+        return "unavailable"
+    if weather.get("error"):
+        return f"unavailable ({weather['error']})"
+
+    day_text = weather.get("today_day")
+    night_text = weather.get("today_night")
+    parts = []
+    if day_text:
+        parts.append(f"{day_text} (day)")
+    if night_text:
+        parts.append(f"{night_text} (night)")
+    return " / ".join(parts) or "no summary"
+
+
+def _air_text(air: Optional[Dict[str, Any]]) -> str:
+    if not air:
+        return "unavailable"
+    if air.get("error"):
+        return f"unavailable ({air['error']})"
+
+    aqi = air.get("aqi")
+    category = air.get("category")
+    if aqi is None and not category:
+        return "no AQI reported"
+    if category:
+        return f"AQI {aqi} ({category})"
+    return f"AQI {aqi}"
+
+
+def _slot_text(slot: Dict[str, Any]) -> str:
+    time_text = slot.get("time") or "any time"
+    name = slot.get("name") or "?"
+
+    if slot.get("error"):
+        return f"{time_text}  {name} — address not found ({slot['error']})"
+
+    address = slot.get("address")
+    text = f"{time_text}  {name} — {address}" if address else f"{time_text}  {name}"
+
+    if slot.get("aqi") is not None:
+        text += f"  [AQI {slot['aqi']}{', mask' if slot.get('mask_needed') else ''}]"
+    return text
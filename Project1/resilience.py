@@ -0,0 +1,271 @@
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+import metrics
+
+T = TypeVar("T")
+
+# Consecutive failed requests (5xx, timeouts, connection errors, slow calls) that open a circuit
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+# Seconds an open circuit fails fast before one probe request is let through
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+# A request slower than this counts as a failure even if it succeeds
+BREAKER_SLOW_SECONDS = float(os.getenv("BREAKER_SLOW_SECONDS", "10"))
+
+# APIs whose requests are hedged, e.g. "places" or "places,weather" (empty = off).
+# A hedge is a second identical request sent when the first is slower than the
+# API's recent p95; the first answer wins. It costs quota, so it is opt-in.
+HEDGE_APIS = {a.strip() for a in os.getenv("HEDGE_APIS", "").split(",") if a.strip()}
+HEDGE_QUANTILE = float(os.getenv("HEDGE_QUANTILE", "0.95"))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.05"))
+# No hedging until this many latencies have been seen
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+LATENCY_WINDOW = int(os.getenv("LATENCY_WINDOW", "200"))
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of sending a request while an API's circuit is open.
+    """
+
+
+class Endpoint:
+    """
+    Circuit breaker and recent latencies of one API, shared by sync and async callers.
+
+    Closed: requests go through; BREAKER_FAILURES failures in a row open the circuit.
+    Open: requests fail fast with CircuitOpenError; every BREAKER_RESET_SECONDS one
+    probe is let through, and the circuit closes again when a probe succeeds.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        hedge: bool = False,
+        failures: int = BREAKER_FAILURES,
+        reset_seconds: float = BREAKER_RESET_SECONDS,
+        slow_seconds: float = BREAKER_SLOW_SECONDS,
+    ):
+        self.name = name
+        self.hedge = hedge
+        self.max_failures = failures
+        self.reset_seconds = reset_seconds
+        self.slow_seconds = slow_seconds
+
+        self._lock = threading.Lock()
+        self._open = False
+        self._next_probe = 0.0
+        self._latencies: deque = deque(maxlen=LATENCY_WINDOW)
+
+        self.failures = 0
+        self.opened = 0
+        self.rejected = 0
+        self.probes = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    # -------------------------
+    # Circuit breaker
+    # -------------------------
+    def allow(self) -> None:
+        with self._lock:
+            if not self._open:
+                return
+            now = time.monotonic()
+            if now < self._next_probe:
+                self.rejected += 1
+                raise CircuitOpenError(
+                    f"{self.name} API unavailable (circuit open after {self.failures} failures)"
+                )
+            # Let this request probe; everyone else keeps failing fast meanwhile
+            self._next_probe = now + self.reset_seconds
+            self.probes += 1
+
+    def record(self, ok: bool, seconds: float) -> None:
+        """
+        Outcome of one request (after retries and hedging); `seconds` is its time
+        on the wire, never time spent queued for quota or backing off.
+        """
+        failed = not ok or seconds > self.slow_seconds
+        with self._lock:
+            if not failed:
+                self.failures = 0
+                self._open = False
+                return
+            self.failures += 1
+            if self._open:
+                # Failed probe: wait another reset period
+                self._next_probe = time.monotonic() + self.reset_seconds
+            elif self.failures >= self.max_failures:
+                self._open = True
+                self.opened += 1
+                self._next_probe = time.monotonic() + self.reset_seconds
+
+    # -------------------------
+    # Latency / hedging
+    # -------------------------
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def hedge_delay(self) -> Optional[float]:
+        """
+        Seconds to wait before hedging (the recent p95 latency), or None when not hedging.
+        """
+        if not self.hedge:
+            return None
+        with self._lock:
+            if len(self._latencies) < HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * HEDGE_QUANTILE))
+        return max(HEDGE_MIN_DELAY, ordered[index])
+
+    def stats(self) -> Dict[str, Any]:
+        delay = self.hedge_delay()
+        with self._lock:
+            return {
+                "state": "open" if self._open else "closed",
+                "consecutive_failures": self.failures,
+                "opened": self.opened,
+                "rejected": self.rejected,
+                "probes": self.probes,
+                "hedging": self.hedge,
+                "hedge_delay_ms": round(delay * 1000, 1) if delay is not None else None,
+                "hedged": self.hedged,
+                "hedge_wins": self.hedge_wins,
+            }
+
+
+endpoints: Dict[str, Endpoint] = {
+    name: Endpoint(name, hedge=name in HEDGE_APIS) for name in ("places", "weather", "air_quality")
+}
+
+
+def endpoint(api: Optional[str]) -> Optional[Endpoint]:
+    return endpoints.get(api) if api else None
+
+
+# -------------------------
+# Hedged calls
+# -------------------------
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _hedge_pool() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="hedge")
+        return _pool
+
+
+def hedged(ep: Optional[Endpoint], send: Callable[[], T], acquire: Optional[Callable[[], Any]] = None) -> T:
+    """
+    acquire() (the quota token) then send() once; if it has not answered after
+    the endpoint's hedge delay, acquire() and send() again and return whichever
+    answer comes first (the slower one is discarded). The delay starts once the
+    token is held, so time queued for quota never triggers a hedge.
+    """
+    if acquire is not None:
+        acquire()
+    delay = ep.hedge_delay() if ep is not None else None
+    if delay is None:
+        return send()
+
+    def send_again() -> T:
+        if acquire is not None:
+            acquire()
+        return send()
+
+    pool = _hedge_pool()
+    primary = metrics.submit_in_context(pool, send)
+    done, _ = wait([primary], timeout=delay)
+    if done:
+        return primary.result()
+
+    with ep._lock:
+        ep.hedged += 1
+    backup = metrics.submit_in_context(pool, send_again)
+    pending = {primary, backup}
+    error: Optional[BaseException] = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if future is backup:
+                    with ep._lock:
+                        ep.hedge_wins += 1
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+async def ahedged(
+    ep: Optional[Endpoint],
+    send: Callable[[], Awaitable[T]],
+    acquire: Optional[Callable[[], Awaitable[Any]]] = None,
+) -> T:
+    """
+    Async hedged(); the losing request is cancelled.
+    """
+    if acquire is not None:
+        await acquire()
+    delay = ep.hedge_delay() if ep is not None else None
+    if delay is None:
+        return await send()
+
+    async def send_again() -> T:
+        if acquire is not None:
+            await acquire()
+        return await send()
+
+    primary = asyncio.ensure_future(send())
+    done, _ = await asyncio.wait({primary}, timeout=delay)
+    if done:
+        return primary.result()
+
+    with ep._lock:
+        ep.hedged += 1
+    backup = asyncio.ensure_future(send_again())
+    pending = {primary, backup}
+    error: Optional[BaseException] = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is backup:
+                        with ep._lock:
+                            ep.hedge_wins += 1
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def stats() -> Dict[str, Dict[str, Any]]:
+    """
+    Breaker state and hedging counters per API.
+    """
+    return {name: ep.stats() for name, ep in endpoints.items()}
+
+
+def format_stats() -> str:
+    lines = []
+    for name, s in stats().items():
+        if not (s["opened"] or s["rejected"] or s["hedged"] or s["consecutive_failures"]):
+            continue
+        lines.append(
+            f"{name:>11}: circuit {s['state']}  opened {s['opened']}  fast-failed {s['rejected']}  "
+            f"hedged {s['hedged']} (won {s['hedge_wins']})"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,325 @@
+"""
+Long-running HTTP planning service.
+
+Imports the agent once and keeps it, the HTTP connection pools, the rate-limit
+buckets and every cache warm across requests, so a request only pays for the
+planning work itself. Requests are served concurrently (one thread each, at most
+SERVICE_MAX_CONCURRENCY planning at once).
+
+Endpoints:
+    POST /v1/plan         {"itinerary": "...", "thread_id": "...", "renderer": "local|llm", "concurrent": false}
+                          -> {"thread_id": ..., "text": rendered itinerary,  (run_agent)
+                              "usage": this run's tokens / model latency / API requests,
+                              "thread_usage": totals for the thread}
+    POST /v1/build_plan   {"itinerary": "...", "concurrent": false}
+                          -> {"plan": {...}}                                 (build_plan, via the plan cache)
+    GET  /v1/usage?thread_id=...  -> token / API-request totals and recent runs of a thread
+    GET  /healthz         -> {"status": "ok", "uptime_s": ..., "in_flight": ...}
+    GET  /metrics         -> Prometheus text (?format=json for JSON incl. caches and rate limits)
+
+A text/plain body is taken as the itinerary itself. A malformed itinerary gets
+400 with "errors": [{"line", "column", "message"}, ...].
+
+Usage:
+    uv run python server.py --port 8080
+    curl -s localhost:8080/v1/plan -d 'City1: Toronto 2026-02-01 CN Tower;8am-9am'
+"""
+import os
+import json
+import time
+import uuid
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import cache
+import metrics
+import ratelimit
+import resilience
+import http_client
+from compact import compaction_stats
+from usage import thread_usage
+from itinerary import iter_text_days
+from agent_app_fixed import checkpointer, cached_build_plan, run_agent_with_usage
+
+SERVICE_MAX_CONCURRENCY = int(os.getenv("SERVICE_MAX_CONCURRENCY", "16"))
+# How long a request may wait for a planning slot before getting 503
+SERVICE_QUEUE_TIMEOUT = float(os.getenv("SERVICE_QUEUE_TIMEOUT", "30"))
+# Request bodies larger than this are rejected (413)
+SERVICE_MAX_BODY_BYTES = int(os.getenv("SERVICE_MAX_BODY_BYTES", str(256 * 1024)))
+# Parsing a malformed itinerary stops after this many errors
+SERVICE_MAX_PARSE_ERRORS = int(os.getenv("SERVICE_MAX_PARSE_ERRORS", "20"))
+
+
+class BadRequest(Exception):
+    def __init__(self, status: int, message: str, details: Optional[List[Dict[str, Any]]] = None):
+        super().__init__(message)
+        self.status = status
+        self.details = details
+
+
+class ServiceState:
+    """
+    Shared by every request thread: the planning slots and request counters.
+    """
+
+    def __init__(self, max_concurrency: int = SERVICE_MAX_CONCURRENCY):
+        self.started = time.time()
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self.max_concurrency = max_concurrency
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.requests = 0
+        self.rejected = 0
+
+    def health(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "status": "ok",
+                "uptime_s": round(time.time() - self.started, 1),
+                "requests": self.requests,
+                "in_flight": self.in_flight,
+                "max_concurrency": self.max_concurrency,
+                "rejected": self.rejected,
+            }
+
+
+def metrics_json(state: ServiceState) -> Dict[str, Any]:
+    return {
+        "service": state.health(),
+        "calls": metrics.registry.to_json(),
+        "api_requests": metrics.registry.api_requests(),
+        "rate_limits": ratelimit.stats(),
+        "circuit_breakers": resilience.stats(),
+        "caches": {
+            "geocode": cache.geocode_cache.stats(),
+            "attractions": cache.attractions_cache.stats(),
+            "plans": cache.plan_cache.stats(),
+            **cache.forecast_cache_stats(),
+        },
+        "checkpoints": checkpointer.stats() if hasattr(checkpointer, "stats") else None,
+        "prompt_compaction": compaction_stats(),
+    }
+
+
+class PlanningHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state: ServiceState = None
+
+    def log_message(self, format, *args):
+        pass
+
+    # -------------------------
+    # Routing
+    # -------------------------
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+
+        self._discard_body()
+        if url.path in ("/healthz", "/health"):
+            self._send_json(200, self.state.health())
+        elif url.path == "/v1/usage":
+            totals = thread_usage(query.get("thread_id", ""))
+            if totals is None:
+                self._send_json(404, {"error": "No usage recorded for this thread_id"})
+            else:
+                self._send_json(200, {"thread_id": query["thread_id"], "usage": totals})
+        elif url.path == "/metrics":
+            if query.get("format") == "json":
+                self._send_json(200, metrics_json(self.state))
+            else:
+                self._send(200, metrics.registry.to_prometheus().encode("utf-8"), "text/plain; version=0.0.4")
+        else:
+            self._send_json(404, {"error": f"Unknown path {url.path}"})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        routes = {"/v1/plan": self._plan, "/v1/build_plan": self._build_plan}
+        handler = routes.get(url.path)
+        if handler is None:
+            self._discard_body()
+            self._send_json(404, {"error": f"Unknown path {url.path}"})
+            return
+
+        try:
+            body = self._read_body()
+            status, payload = self._with_slot(handler, body)
+        except BadRequest as e:
+            status, payload = e.status, {"error": str(e)}
+            if e.details:
+                payload["errors"] = e.details
+        except Exception as e:
+            status, payload = 500, {"error": f"{type(e).__name__}: {e}"}
+        self._send_json(status, payload)
+
+    # -------------------------
+    # Planning endpoints
+    # -------------------------
+    def _plan(self, body: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        thread_id = body.get("thread_id") or uuid.uuid4().hex
+        text = _itinerary(body)
+        _parse(text)
+        result = run_agent_with_usage(
+            text,
+            thread_id=thread_id,
+            concurrent=bool(body.get("concurrent")),
+            renderer=_renderer(body.get("renderer")),
+        )
+        return 200, {"thread_id": thread_id, **result}
+
+    def _build_plan(self, body: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        trip = _parse(_itinerary(body))
+        return 200, {"plan": cached_build_plan(trip, concurrent=bool(body.get("concurrent")))}
+
+    # -------------------------
+    # Helpers
+    # -------------------------
+    def _with_slot(self, handler, body):
+        state = self.state
+        if not state.slots.acquire(timeout=SERVICE_QUEUE_TIMEOUT):
+            with state.lock:
+                state.rejected += 1
+            raise BadRequest(503, "Too many plans in progress, retry later")
+
+        with state.lock:
+            state.in_flight += 1
+            state.requests += 1
+        try:
+            return handler(body)
+        finally:
+            with state.lock:
+                state.in_flight -= 1
+            state.slots.release()
+
+    def _content_length(self) -> int:
+        # -1 when the header is not a valid length
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            return -1
+        return length if length >= 0 else -1
+
+    def _discard_body(self) -> None:
+        """
+        Read and drop a body this request does not use. Any body left unread would
+        be parsed as the next request on the connection, so a body that is not
+        read here closes the connection instead.
+        """
+        length = self._content_length()
+        if 0 <= length <= SERVICE_MAX_BODY_BYTES:
+            self.rfile.read(length)
+        else:
+            self.close_connection = True
+
+    def _read_body(self) -> Dict[str, Any]:
+        # The body is left unread on these errors, so the connection can't be
+        # reused: its bytes would be parsed as the next request
+        length = self._content_length()
+        if length < 0:
+            self.close_connection = True
+            raise BadRequest(400, "Invalid Content-Length")
+        if length > SERVICE_MAX_BODY_BYTES:
+            self.close_connection = True
+            raise BadRequest(413, f"Body larger than {SERVICE_MAX_BODY_BYTES} bytes")
+        try:
+            raw = self.rfile.read(length).decode("utf-8") if length else ""
+        except UnicodeDecodeError as e:
+            raise BadRequest(400, f"Body is not valid UTF-8: {e}")
+
+        if "application/json" not in (self.headers.get("Content-Type") or ""):
+            return {"itinerary": raw}
+        try:
+            body = json.loads(raw or "{}")
+        except ValueError as e:
+            raise BadRequest(400, f"Invalid JSON: {e}")
+        if not isinstance(body, dict):
+            raise BadRequest(400, "JSON body must be an object")
+        return body
+
+    def _send_json(self, status: int, payload: Dict[str, Any]):
+        self._send(status, json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json; charset=UTF-8")
+
+    def _send(self, status: int, data: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def _itinerary(body: Dict[str, Any]) -> str:
+    text = body.get("itinerary")
+    if not isinstance(text, str) or not text.strip():
+        raise BadRequest(400, 'Missing "itinerary" text')
+    return text
+
+
+def _parse(text: str) -> List[Dict[str, Any]]:
+    # Reject malformed itineraries with where they went wrong, rather than
+    # silently planning whatever part of them parsed
+    errors = []
+    trip = []
+    for day in iter_text_days(text, errors):
+        if len(errors) >= SERVICE_MAX_PARSE_ERRORS:
+            break
+        trip.append(day)
+    if errors:
+        details = [e.as_dict() for e in errors[:SERVICE_MAX_PARSE_ERRORS]]
+        raise BadRequest(400, f"Invalid itinerary: {errors[0]}", details)
+    if not trip:
+        raise BadRequest(400, "Invalid itinerary: no 'City1: <city> <YYYY-MM-DD>' day found")
+    return trip
+
+
+def _renderer(value: Optional[str]) -> Optional[str]:
+    if value not in (None, "local", "llm"):
+        raise BadRequest(400, 'renderer must be "local" or "llm"')
+    return value
+
+
+def start_server(
+    host: str = "127.0.0.1",
+    port: int = 8080,
+    max_concurrency: int = SERVICE_MAX_CONCURRENCY,
+) -> Tuple[ThreadingHTTPServer, str]:
+    """
+    Start the service in a background thread. Returns (server, base_url);
+    call server.shutdown() when done.
+    """
+    server = make_server(host, port, max_concurrency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_port}"
+
+
+def make_server(host: str, port: int, max_concurrency: int) -> ThreadingHTTPServer:
+    handler = type("ConfiguredPlanningHandler", (PlanningHandler,), {"state": ServiceState(max_concurrency)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve trip planning over HTTP with warm agent, pools and caches.")
+    parser.add_argument("--host", default=os.getenv("SERVICE_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("SERVICE_PORT", "8080")))
+    parser.add_argument("--max-concurrency", type=int, default=SERVICE_MAX_CONCURRENCY)
+    args = parser.parse_args(argv)
+
+    server = make_server(args.host, args.port, args.max_concurrency)
+    print(f"Planning service on http://{args.host}:{server.server_port}  (POST /v1/plan, GET /healthz, GET /metrics)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        http_client.close_all()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""
+Local stand-in for the three Google endpoints used by tools.py, for offline
+load tests and benchmarks.
+
+Serves the same response shapes as:
+    GET  /maps/api/place/textsearch/json   (Places Text Search)
+    GET  /v1/forecast/days:lookup           (Weather forecast.days)
+    POST /v1/forecast:lookup                (Air Quality forecast)
+
+built from the sample responses in fixtures/. Unknown places get a deterministic
+synthetic result; queries containing "nowhere" return ZERO_RESULTS.
+
+Usage:
+    uv run python stub_server.py --port 8765 --latency-ms 80 --jitter-ms 40 --error-rate 0.02
+    GOOGLE_API_BASE_URL=http://127.0.0.1:8765 uv run python agent_app_fixed.py
+"""
+import os
+import copy
+import json
+import time
+import random
+import zlib
+import argparse
+import threading
+import datetime as dt
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+PLACES_PATH = "/maps/api/place/textsearch/json"
+WEATHER_PATH = "/v1/forecast/days:lookup"
+AIR_QUALITY_PATH = "/v1/forecast:lookup"
+
+DAY_CONDITIONS = [("Partly cloudy", "PARTLY_CLOUDY"), ("Sunny", "CLEAR"), ("Light rain", "LIGHT_RAIN"), ("Cloudy", "CLOUDY")]
+
+
+def _load_fixture(name: str) -> Any:
+    with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as f:
+        return json.load(f)
+
+
+class StubConfig:
+    """
+    Latency (mean + uniform jitter, in ms) and error injection shared by all handlers.
+    error_rate is the fraction of requests answered with 503 (or 429 when
+    rate_limit_share of those errors should look like quota exhaustion).
+    """
+
+    def __init__(
+        self,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        error_rate: float = 0.0,
+        rate_limit_share: float = 0.5,
+        seed: int = 0,
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_share = rate_limit_share
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests: Dict[str, int] = {"places": 0, "weather": 0, "air_quality": 0, "errors": 0}
+
+    def delay(self) -> float:
+        with self.lock:
+            jitter = self.rng.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+        return max(0.0, self.latency_ms + jitter) / 1000
+
+    def injected_error(self):
+        with self.lock:
+            if self.error_rate <= 0 or self.rng.random() >= self.error_rate:
+                return None
+            self.requests["errors"] += 1
+            return 429 if self.rng.random() < self.rate_limit_share else 503
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # wfile is unbuffered: headers and body go out as separate small writes, and with
+    # Nagle on the body waits for the client's delayed ACK (~40ms per keep-alive response)
+    disable_nagle_algorithm = True
+    config: StubConfig = StubConfig()
+    places = _load_fixture("places_textsearch.json")
+    weather_day = _load_fixture("weather_forecast_day.json")
+    air_hour = _load_fixture("air_quality_hour.json")
+
+    def log_message(self, format, *args):
+        pass
+
+    # -------------------------
+    # Routing
+    # -------------------------
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+
+        if url.path == PLACES_PATH:
+            self._respond("places", lambda: self._places(query))
+        elif url.path == WEATHER_PATH:
+            self._respond("weather", lambda: self._weather(query))
+        else:
+            self._send(404, {"error": {"code": 404, "message": f"Unknown path {url.path}"}})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+
+        if url.path == AIR_QUALITY_PATH:
+            self._respond("air_quality", lambda: self._air_quality(body))
+        else:
+            self._send(404, {"error": {"code": 404, "message": f"Unknown path {url.path}"}})
+
+    def _respond(self, api: str, build):
+        with self.config.lock:
+            self.config.requests[api] += 1
+
+        time.sleep(self.config.delay())
+
+        status = self.config.injected_error()
+        if status is not None:
+            headers = {"Retry-After": "0"} if status == 429 else {}
+            self._send(status, {"error": {"code": status, "message": "Injected error", "status": "UNAVAILABLE"}}, headers)
+            return
+
+        status, payload = build()
+        self._send(status, payload)
+
+    def _send(self, status: int, payload: Dict[str, Any], headers: Dict[str, str] = None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    # -------------------------
+    # Response builders
+    # -------------------------
+    def _places(self, query: Dict[str, str]) -> Tuple[int, Dict[str, Any]]:
+        text = query.get("query", "")
+        key = " ".join(text.casefold().split())
+
+        if "nowhere" in key:
+            return 200, {"html_attributions": [], "results": [], "status": "ZERO_RESULTS"}
+
+        result = self.places.get(key)
+        if result is None:
+            result = _synthetic_place(text)
+        return 200, {"html_attributions": [], "results": [result], "status": "OK"}
+
+    def _weather(self, query: Dict[str, str]) -> Tuple[int, Dict[str, Any]]:
+        days = max(1, min(int(query.get("days", 1)), 10))
+        lat = float(query.get("location.latitude", 0))
+        today = dt.date.today()
+
+        forecast_days = []
+        for i in range(days):
+            date = today + dt.timedelta(days=i)
+            day = copy.deepcopy(self.weather_day)
+            day["displayDate"] = {"year": date.year, "month": date.month, "day": date.day}
+            start = dt.datetime(date.year, date.month, date.day, 12)
+            day["interval"] = {
+                "startTime": start.isoformat() + "Z",
+                "endTime": (start + dt.timedelta(days=1)).isoformat() + "Z",
+            }
+            text, kind = DAY_CONDITIONS[(date.toordinal() + int(lat)) % len(DAY_CONDITIONS)]
+            day["daytimeForecast"]["weatherCondition"]["description"]["text"] = text
+            day["daytimeForecast"]["weatherCondition"]["type"] = kind
+            forecast_days.append(day)
+
+        return 200, {"forecastDays": forecast_days, "timeZone": {"id": "UTC"}}
+
+    def _air_quality(self, body: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        period = body.get("period") or {}
+        try:
+            start = dt.datetime.fromisoformat(period["startTime"].rstrip("Z"))
+            end = dt.datetime.fromisoformat(period["endTime"].rstrip("Z"))
+        except (KeyError, ValueError):
+            return 400, {"error": {"code": 400, "message": "Invalid period", "status": "INVALID_ARGUMENT"}}
+
+        lat = float((body.get("location") or {}).get("latitude", 0))
+
+        hourly = []
+        t = start
+        while t < end:
+            hour = copy.deepcopy(self.air_hour)
+            hour["dateTime"] = t.isoformat() + "Z"
+            # Afternoon ozone bump so some slots cross the mask threshold
+            aqi = 55 + int(abs(lat)) % 20 + (45 if 13 <= t.hour <= 17 else 0)
+            index = hour["indexes"][0]
+            index["aqi"] = aqi
+            index["aqiDisplay"] = str(aqi)
+            index["category"] = "Good air quality" if aqi < 100 else "Unhealthy for sensitive groups"
+            hourly.append(hour)
+            t += dt.timedelta(hours=1)
+
+        return 200, {"hourlyForecasts": hourly, "regionCode": "us", "nextPageToken": ""}
+
+
+def _synthetic_place(query: str) -> Dict[str, Any]:
+    seed = zlib.crc32(query.casefold().encode("utf-8"))
+    name, _, city = query.partition(",")
+    return {
+        "name": name.strip(),
+        "formatted_address": f"{seed % 900 + 100} Main St, {city.strip() or 'Springfield'}",
+        "geometry": {"location": {"lat": 20 + (seed % 4000) / 100, "lng": -120 + (seed // 4000 % 6000) / 100}},
+        "place_id": f"stub-{seed:x}",
+        "types": ["tourist_attraction", "point_of_interest", "establishment"],
+    }
+
+
+class StubServer(ThreadingHTTPServer):
+    # listen() backlog: the default of 5 makes a burst of concurrent benchmark
+    # connections wait out SYN retries (seconds), which would show up as API latency
+    request_queue_size = 128
+    daemon_threads = True
+
+
+def start_stub_server(
+    host: str = "127.0.0.1",
+    port: int = 0,
+    config: StubConfig = None,
+) -> Tuple[StubServer, str]:
+    """
+    Start the stub in a background thread. Returns (server, base_url);
+    call server.shutdown() when done.
+    """
+    handler = type("ConfiguredStubHandler", (StubHandler,), {"config": config or StubConfig()})
+    server = StubServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_port}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local stand-in for the Google Places/Weather/Air Quality APIs.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="mean added latency per request")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="uniform +/- jitter around the mean")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests that fail (429/503)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    config = StubConfig(args.latency_ms, args.jitter_ms, args.error_rate, seed=args.seed)
+    handler = type("ConfiguredStubHandler", (StubHandler,), {"config": config})
+    server = StubServer((args.host, args.port), handler)
+
+    print(f"Stub Google APIs on http://{args.host}:{args.port}  (set GOOGLE_API_BASE_URL to this)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"requests: {config.requests}")
+
+
+if __name__ == "__main__":
+    main()
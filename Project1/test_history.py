@@ -0,0 +1,52 @@
+import json
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from history import SUMMARY_HEADER, SUMMARY_HEADER_NO_PLAN, _is_summary, compact_history
+
+
+def _plan(city):
+    data = {"days": [{"city": city, "date": "2026-03-01", "slots": [["8am-9am", "Museum"]]}], "total_masks": 1}
+    return HumanMessage(content="PLAN_DATA: " + json.dumps(data))
+
+
+def test_plan_turn_is_kept_when_a_follow_up_is_newest():
+    messages = [
+        _plan("Rome"), AIMessage(content="Rome plan"),
+        _plan("Paris"), AIMessage(content="Paris plan"),
+        HumanMessage(content="Which day is rainiest?"), AIMessage(content="Day 1"),
+        HumanMessage(content="And the air quality?"),
+    ]
+    compacted = compact_history(messages, ceiling=10_000)
+
+    summary, *kept = compacted
+    assert _is_summary(summary)
+    assert summary.content.splitlines()[0] == SUMMARY_HEADER
+    assert "Rome" in summary.content and "Paris" not in summary.content
+    # The Paris plan and the replies after it are untouched
+    assert kept == messages[2:]
+
+
+def test_no_plan_turn_keeps_latest_turn_only():
+    messages = [
+        HumanMessage(content="hi"), AIMessage(content="hello"),
+        HumanMessage(content="plan something"),
+    ]
+    summary, *kept = compact_history(messages, ceiling=10_000)
+
+    assert summary.content.splitlines() == [SUMMARY_HEADER_NO_PLAN, "- asked: hi"]
+    assert kept == messages[2:]
+
+
+def test_nothing_before_latest_plan():
+    messages = [_plan("Rome"), AIMessage(content="Rome plan"), HumanMessage(content="thanks")]
+    assert compact_history(messages) is None
+
+
+def test_rolling_summary_is_extended():
+    first = compact_history([_plan("Rome"), AIMessage(content="a"), _plan("Paris")], ceiling=10_000)
+    second = compact_history([*first, AIMessage(content="b"), _plan("Oslo")], ceiling=10_000)
+
+    lines = second[0].content.splitlines()[1:]
+    assert len(lines) == 2 and "Rome" in lines[0] and "Paris" in lines[1]
+    assert len(second) == 2 and "Oslo" in second[1].content
@@ -0,0 +1,70 @@
+import time
+import types
+from email.utils import formatdate
+
+import pytest
+
+import http_client
+import ratelimit
+
+
+class Response:
+    def __init__(self, status_code, retry_after=None):
+        self.status_code = status_code
+        self.headers = {"Retry-After": retry_after} if retry_after is not None else {}
+
+
+class Session:
+    def __init__(self, responses):
+        self.responses = list(responses)
+
+    def request(self, method, url, **kwargs):
+        return self.responses.pop(0)
+
+
+class Bucket:
+    def __init__(self):
+        self.paused = []
+
+    def acquire(self):
+        return 0.0
+
+    def pause(self, seconds):
+        self.paused.append(seconds)
+
+
+@pytest.fixture
+def slept(monkeypatch):
+    slept = []
+    fake_time = types.SimpleNamespace(monotonic=time.monotonic, time=time.time, sleep=slept.append)
+    monkeypatch.setattr(http_client, "time", fake_time)
+    monkeypatch.setattr(http_client, "RETRY_AFTER_MAX_SECONDS", 30.0)
+    return slept
+
+
+@pytest.mark.parametrize(
+    "value, seconds",
+    [("5", 5.0), ("86400", 30.0), ("-3", 0.0), (formatdate(time.time() + 86400, usegmt=True), 30.0), ("soon", None)],
+)
+def test_retry_after_is_clamped(slept, value, seconds):
+    assert http_client._retry_after_seconds(Response(503, value)) == seconds
+
+
+def test_huge_retry_after_sleeps_the_maximum(slept, monkeypatch):
+    monkeypatch.setattr(http_client, "session_for", lambda url: Session([Response(503, "86400"), Response(200)]))
+
+    response, _ = http_client._request_with_retries("GET", "http://stub/x", None, None, None)
+    assert response.status_code == 200
+    assert slept == [30.0]
+
+
+def test_huge_retry_after_pauses_the_bucket_the_maximum(slept, monkeypatch):
+    bucket = Bucket()
+    monkeypatch.setattr(ratelimit, "bucket", lambda api: bucket)
+    monkeypatch.setattr(http_client, "MAX_RETRIES", 1)
+    monkeypatch.setattr(http_client, "session_for", lambda url: Session([Response(429, "86400")] * 2))
+
+    response, _ = http_client._request_with_retries("GET", "http://stub/x", "places", None, None)
+    # One pause before the retry, one when still throttled after it
+    assert response.status_code == 429
+    assert bucket.paused == [30.0, 30.0]
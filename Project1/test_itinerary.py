@@ -0,0 +1,144 @@
+import io
+import time
+
+import pytest
+
+from benchmark import _legacy_parse, make_itinerary
+from itinerary import ItinerarySyntaxError, iter_days, iter_text_days, parse_itinerary
+
+TORONTO = "City1: Toronto 2026-01-31 CN Tower;8am-9am Royal Ontario Museum;10am-11am"
+CHICAGO = "City2: Chicago 2026-02-01 Millennium Park;9am-10am Art Institute of Chicago;11am-12pm"
+NO_SLOTS = "City1: Toronto 2026-01-31\nCity2: Chicago 2026-02-01"
+
+
+def _errors(text):
+    errors = []
+    trip = parse_itinerary(text, errors)
+    return trip, [(e.line, e.column, e.message) for e in errors]
+
+
+# -------------------------
+# Same days as the old regex parser
+# -------------------------
+@pytest.mark.parametrize("text", [
+    TORONTO,
+    NO_SLOTS,
+    TORONTO + " " + NO_SLOTS.splitlines()[1],
+    "City1: Toronto 2026-01-31 CN Tower;8am-9am\nCity2: Paris 2026-02-01 Louvre;10am-11am",
+    make_itinerary(8, 8, 1, place="Landmark"),
+])
+def test_same_as_legacy_parser(text):
+    assert parse_itinerary(text) == _legacy_parse(text)
+
+
+def test_fixes_legacy_names_and_cities():
+    # The old parser read "9am-10am A" as the time and "rt Institute of Chicago" as the place
+    legacy = _legacy_parse(CHICAGO)[0]["slots"]
+    assert legacy[0]["time"] == "9am-10am A"
+
+    [day] = parse_itinerary(CHICAGO)
+    assert day["slots"] == [
+        {"name": "Millennium Park", "time": "9am-10am"},
+        {"name": "Art Institute of Chicago", "time": "11am-12pm"},
+    ]
+
+    [day] = parse_itinerary("City1: New York 2026-03-01 Guggenheim;9:00 AM – 10:30 AM")
+    assert (day["city"], day["slots"][0]["time"]) == ("New York", "9:00 AM – 10:30 AM")
+
+
+def test_days_may_continue_on_the_next_line():
+    [day] = parse_itinerary("City1: Rome 2026-03-02\n  Colosseum;3pm\r\n  Pantheon;14:00-15:30\n")
+    assert [s["name"] for s in day["slots"]] == ["Colosseum", "Pantheon"]
+
+
+# -------------------------
+# Error positions
+# -------------------------
+def test_missing_semicolon():
+    trip, errors = _errors("City1: Paris 2026-03-01 Louvre 9am-10am Orsay;11am-12pm Tower;1pm-2pm")
+    assert errors == [(1, 25, "missing ';' between place and time in 'Louvre 9am-10am Orsay'")]
+    assert trip[0]["slots"] == [{"name": "Tower", "time": "1pm-2pm"}]
+
+
+def test_bad_time_and_missing_place():
+    text = "City1: Rome 2026-03-02 Colosseum;noon Forum;9am-10am\nCity2: Milan 2026-03-03 ;9am Duomo;3pm"
+    trip, errors = _errors(text)
+    assert errors == [
+        (1, 34, "expected a time like 8am-9am after ';'"),
+        (2, 25, "missing place name before ';'"),
+    ]
+    assert [s["name"] for d in trip for s in d["slots"]] == ["Forum", "Duomo"]
+
+
+def test_bad_header_and_text_before_header():
+    text = "hello\nCity1: Oslo\nCity2: Lima 2026-05-01 Plaza;9am"
+    trip, errors = _errors(text)
+    assert errors == [
+        (1, 1, "text before the first 'City1:' header"),
+        (2, 8, "expected '<city> <YYYY-MM-DD>' after the day header"),
+    ]
+    assert [d["city"] for d in trip] == ["Lima"]
+
+
+def test_strict_mode_raises_first_error():
+    with pytest.raises(ItinerarySyntaxError) as e:
+        parse_itinerary("City1: Rome 2026-03-02 Colosseum 3pm")
+    assert (e.value.line, e.value.column) == (1, 24)
+    assert str(e.value).startswith("line 1, column 24: ")
+
+
+@pytest.mark.parametrize("rest", [
+    "word " * 40_000,
+    "Museum;9am " + "word " * 40_000,
+    "word " * 40_000 + ";noon",
+    "Louvre 9am-10am " * 10_000 + "Orsay;11am",
+])
+def test_long_lines_parse_in_linear_time(rest):
+    text = "City1: Paris 2026-03-01 " + rest
+    start = time.perf_counter()
+    trip, errors = _errors(text)
+    # 200 KB on one line: quadratic matching took minutes
+    assert time.perf_counter() - start < 2
+    assert len(trip) == 1 and errors
+
+
+# -------------------------
+# Streaming
+# -------------------------
+def test_iter_days_streams_a_file():
+    text = make_itinerary(50, 3, 2, place="Landmark")
+    assert list(iter_days(io.StringIO(text + "\n"))) == parse_itinerary(text)
+
+
+def test_iter_days_is_lazy():
+    def lines():
+        yield "City1: Toronto 2026-01-31 CN Tower;8am-9am\n"
+        yield "City2: Chicago 2026-02-01 Millennium Park;9am-10am\n"
+        raise AssertionError("read past the second day")
+
+    days = iter_days(lines())
+    assert next(days)["city"] == "Toronto"
+
+
+def test_first_line_offset():
+    errors = []
+    list(iter_text_days("City1: Rome 2026-03-02\nColosseum 3pm", errors, first_line=40))
+    assert [(e.line, e.column) for e in errors] == [(41, 1)]
+
+
+def test_batch_errors_point_at_input_lines():
+    from batch import read_itineraries
+
+    src = io.StringIO(
+        "City1: Toronto 2026-01-31 CN Tower;8am-9am\n"
+        "\n"
+        "City1: Rome 2026-03-02\n"
+        "   Colosseum;noon\n"
+    )
+    records = list(read_itineraries(src))
+    assert [first for first, _ in records] == [1, 3]
+
+    first_line, text = records[1]
+    errors = []
+    list(iter_text_days(text, errors, first_line))
+    assert [(e.line, e.column) for e in errors] == [(4, 14)]
@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+import ratelimit
+from ratelimit import TokenBucket
+
+
+class FakeTime:
+    """
+    monotonic() / sleep() for ratelimit.py: sleeping only moves the clock.
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeTime()
+    monkeypatch.setattr(ratelimit, "time", fake)
+    return fake
+
+
+def test_burst_then_paced(clock):
+    bucket = TokenBucket("places", 10, headroom=0, burst_seconds=0, min_burst=3)
+    waits = [bucket.acquire() for _ in range(5)]
+
+    # Three tokens of burst, then one every 1/10 s
+    assert waits[:3] == [0.0, 0.0, 0.0]
+    assert waits[3:] == pytest.approx([0.1, 0.1])
+    assert clock.now == pytest.approx(1000.2)
+    stats = bucket.stats()
+    assert (stats["requests"], stats["waited"], stats["queue_depth"]) == (5, 2, 0)
+
+
+def test_waiting_callers_queue_in_arrival_order(clock):
+    bucket = TokenBucket("places", 10, headroom=0, burst_seconds=0, min_burst=1)
+    # Reservations without sleeping, as concurrent callers would make them
+    assert [bucket._reserve() for _ in range(4)] == pytest.approx([0.0, 0.1, 0.2, 0.3])
+    assert bucket.stats()["max_queue_depth"] == 3
+
+
+def test_refills_up_to_burst(clock):
+    bucket = TokenBucket("places", 10, headroom=0, burst_seconds=0, min_burst=2)
+    for _ in range(2):
+        bucket.acquire()
+    clock.now += 60
+    # Idle time never banks more than the burst
+    assert [bucket._reserve() for _ in range(3)] == pytest.approx([0.0, 0.0, 0.1])
+
+
+def test_pause_holds_callers_without_burst(clock):
+    bucket = TokenBucket("places", 10, headroom=0, burst_seconds=0, min_burst=5)
+    bucket.pause(2.0)
+    # The pause empties the bucket: the first caller goes one paced interval after it
+    assert bucket.acquire() == pytest.approx(2.1)
+    assert bucket.acquire() == pytest.approx(0.1)
+    assert bucket.stats()["throttled"] == 1
+
+
+def test_headroom_and_disabled_bucket(clock):
+    assert TokenBucket("weather", 100, headroom=0.05).rate == pytest.approx(95)
+
+    off = TokenBucket("weather", 0)
+    assert [off.acquire() for _ in range(100)] == [0.0] * 100
+    assert off.stats()["requests"] == 100 and clock.slept == []
+
+
+def test_async_acquire_is_paced(clock, monkeypatch):
+    slept = []
+
+    async def fake_sleep(seconds):
+        slept.append(seconds)
+        clock.now += seconds
+
+    monkeypatch.setattr(ratelimit.asyncio, "sleep", fake_sleep)
+    bucket = TokenBucket("air_quality", 4, headroom=0, burst_seconds=0, min_burst=1)
+
+    async def run():
+        return [await bucket.aacquire() for _ in range(3)]
+
+    assert asyncio.run(run()) == pytest.approx([0.0, 0.25, 0.25])
+    assert slept == pytest.approx([0.25, 0.25])
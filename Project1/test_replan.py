@@ -0,0 +1,120 @@
+import asyncio
+import datetime as dt
+
+from langchain_core.messages import AIMessage
+
+import agent_app_fixed as app
+
+WEATHER_ERROR = {"error": "Weather API returned error"}
+AIR_ERROR = {"error": "Air Quality API returned error"}
+
+
+class FakeApis:
+    """
+    Places / weather / AQ stand-ins; `down` makes weather and AQ fail.
+    """
+
+    def __init__(self):
+        self.down = False
+        self.calls = {"places": 0, "weather": 0, "air": 0}
+
+    def resolve_slot(self, slot, city):
+        self.calls["places"] += 1
+        return {"time": slot.get("time", ""), "name": slot["name"], "address": city, "lat": 43.6, "lon": -79.4}
+
+    def fetch_city_forecast(self, group):
+        self.calls["weather"] += 1
+        if self.down:
+            return WEATHER_ERROR
+        return {"ok": True, "days": {d: {"condition": "Sunny"} for d in group["dates"]}}
+
+    def lookup_air(self, lat, lon):
+        self.calls["air"] += 1
+        return AIR_ERROR if self.down else {"hours": []}
+
+
+def _trip():
+    date = dt.date.today().isoformat()
+    return [{"city": "Toronto", "date": date, "slots": [{"name": "CN Tower", "time": "8am-9am"}]}]
+
+
+def _patch(monkeypatch, apis):
+    monkeypatch.setattr(app, "resolve_slot", apis.resolve_slot)
+    monkeypatch.setattr(app, "fetch_city_forecast", apis.fetch_city_forecast)
+    monkeypatch.setattr(app, "lookup_air", apis.lookup_air)
+
+
+def test_replan_refetches_after_api_recovers(monkeypatch):
+    apis = FakeApis()
+    _patch(monkeypatch, apis)
+
+    apis.down = True
+    trip = _trip()
+    first = app.build_plan(trip)
+    assert first["days"][0]["weather"] == WEATHER_ERROR
+    assert first["days"][0]["air_quality"] == AIR_ERROR
+
+    apis.down = False
+    plan = app.replan(_trip(), {"trip": trip, "plan": first})
+
+    day = plan["days"][0]
+    assert day["weather"] == {"condition": "Sunny"}
+    assert day["air_quality"] == {"hours": []}
+    assert apis.calls["weather"] == 2 and apis.calls["air"] == 2
+    assert plan["replan"]["forecasts_fetched"] == 1 and plan["replan"]["forecasts_reused"] == 0
+    assert plan["replan"]["air_fetched"] == 1 and plan["replan"]["air_reused"] == 0
+    # The resolved place is still reused
+    assert plan["replan"]["slots_reused"] == 1 and apis.calls["places"] == 1
+
+
+def test_replan_reuses_successful_lookups(monkeypatch):
+    apis = FakeApis()
+    _patch(monkeypatch, apis)
+
+    trip = _trip()
+    first = app.build_plan(trip)
+    plan = app.replan(_trip(), {"trip": trip, "plan": first})
+
+    assert plan["days"][0]["weather"] == first["days"][0]["weather"]
+    assert apis.calls == {"places": 1, "weather": 1, "air": 1}
+    assert plan["replan"]["forecasts_reused"] == 1 and plan["replan"]["air_reused"] == 1
+
+
+class FakeAgent:
+    def __init__(self):
+        self.messages = []
+
+    def reply(self, messages):
+        self.messages.append(messages["messages"][-1][1])
+        return {"messages": [AIMessage(content="Your plan is unchanged.")]}
+
+    def invoke(self, messages, config=None):
+        return self.reply(messages)
+
+    async def ainvoke(self, messages, config=None):
+        return self.reply(messages)
+
+
+def test_follow_up_without_days_keeps_the_plan(monkeypatch):
+    apis, agent = FakeApis(), FakeAgent()
+    _patch(monkeypatch, apis)
+    monkeypatch.setattr(app, "agent", agent)
+
+    thread = "follow-up-thread"
+    date = dt.date.today().isoformat()
+    app.run_agent_with_usage(f"City1: Toronto {date}\nCN Tower;8am-9am", thread, renderer="local")
+    _, before = app.plan_store.get(thread)
+
+    question = "Is a mask needed at the CN Tower?"
+    out = app.run_agent_with_usage(question, thread, renderer="local")
+    assert out["text"] == "Your plan is unchanged."
+    assert asyncio.run(app.arun_agent_with_usage(question, thread, renderer="local"))["text"] == out["text"]
+
+    assert agent.messages == [question, question]
+    assert app.plan_store.get(thread) == (True, before)
+    assert app.plan_cache.get(app.plan_cache_key([]))[0] is False
+
+
+def test_empty_plan_is_not_cached():
+    app.remember_plan("empty", [], {"days": []}, {"local": "TOTAL masks needed: 0"})
+    assert app.plan_cache.get("empty")[0] is False
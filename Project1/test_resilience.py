@@ -0,0 +1,113 @@
+import time
+
+import pytest
+
+import resilience
+from resilience import CircuitOpenError, Endpoint
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(resilience, "time", fake)
+    return fake
+
+
+def _endpoint(**kwargs):
+    return Endpoint("places", failures=3, reset_seconds=30, slow_seconds=1, **kwargs)
+
+
+def test_opens_after_consecutive_failures(clock):
+    ep = _endpoint()
+    for _ in range(2):
+        ep.allow()
+        ep.record(False, 0.1)
+    # A success resets the streak
+    ep.record(True, 0.1)
+    for _ in range(3):
+        ep.allow()
+        ep.record(False, 0.1)
+
+    with pytest.raises(CircuitOpenError):
+        ep.allow()
+    assert ep.stats()["state"] == "open" and ep.opened == 1 and ep.rejected == 1
+
+
+def test_one_probe_per_reset_period(clock):
+    ep = _endpoint()
+    for _ in range(3):
+        ep.record(False, 0.1)
+
+    clock.now += 30
+    ep.allow()
+    # Only one caller probes; the rest keep failing fast
+    with pytest.raises(CircuitOpenError):
+        ep.allow()
+
+    # Failed probe: closed to everyone for another period
+    ep.record(False, 0.1)
+    clock.now += 29
+    with pytest.raises(CircuitOpenError):
+        ep.allow()
+
+    clock.now += 1
+    ep.allow()
+    ep.record(True, 0.1)
+    assert ep.stats()["state"] == "closed" and ep.probes == 2
+    ep.allow()
+
+
+def test_slow_success_counts_as_failure(clock):
+    ep = _endpoint()
+    for _ in range(3):
+        ep.record(True, 1.5)
+    assert ep.stats()["state"] == "open"
+
+    ep = _endpoint()
+    for _ in range(3):
+        ep.record(True, 0.9)
+    assert ep.stats()["state"] == "closed" and ep.failures == 0
+
+
+def _hedging_endpoint():
+    ep = Endpoint("places", hedge=True)
+    for _ in range(resilience.HEDGE_MIN_SAMPLES):
+        ep.observe(0.05)
+    return ep
+
+
+def test_hedge_delay_starts_after_the_token():
+    ep = _hedging_endpoint()
+    tokens = []
+
+    def acquire():
+        tokens.append(1)
+        # Queued for quota much longer than the hedge delay
+        time.sleep(0.3)
+
+    assert resilience.hedged(ep, lambda: "ok", acquire) == "ok"
+    assert tokens == [1] and ep.hedged == 0
+
+
+def test_slow_request_is_hedged_with_its_own_token():
+    ep = _hedging_endpoint()
+    tokens = []
+    calls = []
+
+    def send():
+        calls.append(1)
+        if len(calls) == 1:
+            time.sleep(0.5)
+            return "slow"
+        return "fast"
+
+    assert resilience.hedged(ep, send, lambda: tokens.append(1)) == "fast"
+    assert len(tokens) == 2 and ep.hedged == 1 and ep.hedge_wins == 1
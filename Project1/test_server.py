@@ -0,0 +1,65 @@
+import re
+import json
+import socket
+
+import pytest
+
+import server
+
+SMUGGLED = b"GET /healthz HTTP/1.1\r\nHost: x\r\n\r\n"
+
+
+@pytest.fixture(scope="module")
+def port():
+    srv, _ = server.start_server(port=0)
+    yield srv.server_port
+    srv.shutdown()
+
+
+def _exchange(port, data: bytes) -> bytes:
+    """
+    Send raw bytes on one keep-alive connection; read until the server closes it
+    or stays quiet.
+    """
+    with socket.create_connection(("127.0.0.1", port)) as s:
+        s.sendall(data)
+        s.settimeout(1)
+        received = b""
+        try:
+            while True:
+                chunk = s.recv(65536)
+                if not chunk:
+                    break
+                received += chunk
+        except socket.timeout:
+            pass
+    return received
+
+
+def _post(path: str, body: bytes, content_type: str = "application/json") -> bytes:
+    head = f"POST {path} HTTP/1.1\r\nHost: x\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n\r\n"
+    return head.encode() + body
+
+
+def _statuses(received: bytes):
+    # A status line follows the previous response's body directly
+    return [int(code) for code in re.findall(rb"HTTP/1\.\d (\d{3}) ", received)]
+
+
+def test_unknown_path_body_is_not_read_as_a_request(port):
+    received = _exchange(port, _post("/v1/nope", SMUGGLED) + SMUGGLED)
+    # The body is dropped; only the real second request is answered
+    assert _statuses(received) == [404, 200]
+
+
+def test_invalid_utf8_is_a_bad_request(port):
+    received = _exchange(port, _post("/v1/build_plan", b"\xff\xfe", "text/plain") + SMUGGLED)
+    assert _statuses(received) == [400, 200]
+    assert b"not valid UTF-8" in received
+
+
+def test_oversized_body_closes_the_connection(port, monkeypatch):
+    monkeypatch.setattr(server, "SERVICE_MAX_BODY_BYTES", 10)
+    received = _exchange(port, _post("/v1/nope", json.dumps({"x": "y" * 50}).encode()) + SMUGGLED)
+    assert _statuses(received) == [404]
+    assert b"Connection: close" in received
@@ -0,0 +1,115 @@
+import asyncio
+import threading
+import datetime as dt
+
+import agent_app_fixed as app
+from cache import attractions_cache
+
+CITIES = ["Atlantis", "El Dorado", "Shangri-La"]
+
+
+class SlowBatch:
+    """
+    Batch attractions generator that answers only once `release` is set.
+    """
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.prompts = []
+        # Set when a caller blocked on the batch until it gave up
+        self.timed_out = False
+
+    def invoke(self, prompt):
+        self.prompts.append(prompt)
+        if not self.release.wait(5):
+            self.timed_out = True
+            raise TimeoutError("batch call never released")
+        cities = prompt.split(": ", 1)[1].split(". Return")[0].split("; ")
+        return app.AttractionBatch(cities=[app.CityAttractions(city=c, places=[c + " Gate"]) for c in cities])
+
+    async def ainvoke(self, prompt):
+        return await asyncio.to_thread(self.invoke, prompt)
+
+
+class Single:
+    def __init__(self):
+        self.cities = []
+
+    def invoke(self, prompt):
+        self.cities.append(prompt)
+        return app.AttractionList(places=["Main Square"])
+
+    async def ainvoke(self, prompt):
+        return self.invoke(prompt)
+
+
+def _setup(monkeypatch):
+    attractions_cache.clear()
+    batch, single = SlowBatch(), Single()
+    monkeypatch.setattr(app, "_batch_attraction_generator", lambda: batch)
+    monkeypatch.setattr(app, "_attraction_generator", lambda: single)
+    monkeypatch.setattr(app, "catalog_places", lambda city: None)
+
+    def resolve(slot, city):
+        return {"time": slot["time"], "name": slot["name"], "address": city, "lat": 1.0, "lon": 2.0}
+
+    async def aresolve(slot, city):
+        return resolve(slot, city)
+
+    async def anone(*args):
+        return None
+
+    monkeypatch.setattr(app, "resolve_slot", resolve)
+    monkeypatch.setattr(app, "aresolve_slot", aresolve)
+    for name in ("fetch_city_forecast", "lookup_air"):
+        monkeypatch.setattr(app, name, lambda *args: None)
+    for name in ("afetch_city_forecast", "alookup_air"):
+        monkeypatch.setattr(app, name, anone)
+    return batch, single
+
+
+def _trip():
+    date = dt.date.today().isoformat()
+    return [{"city": city, "date": date, "slots": []} for city in CITIES]
+
+
+def test_first_day_does_not_wait_for_batch(monkeypatch):
+    batch, single = _setup(monkeypatch)
+
+    days = app.iter_plan(_trip())
+    first = next(days)
+    assert first["city"] == "Atlantis" and not batch.timed_out
+
+    batch.release.set()
+    rest = list(days)
+    assert [d["schedule"][0]["name"] for d in rest] == ["El Dorado Gate", "Shangri-La Gate"]
+    # The first city got its own call and is not in the batch
+    assert len(single.cities) == 1 and "Atlantis" not in batch.prompts[0]
+
+
+def test_async_first_day_does_not_wait_for_batch(monkeypatch):
+    batch, single = _setup(monkeypatch)
+
+    async def run():
+        days = app.aiter_plan(_trip())
+        first = await days.__anext__()
+        assert first["city"] == "Atlantis" and not batch.timed_out
+        batch.release.set()
+        return [d async for d in days]
+
+    rest = asyncio.run(run())
+    assert [d["schedule"][0]["name"] for d in rest] == ["El Dorado Gate", "Shangri-La Gate"]
+    assert len(single.cities) == 1
+
+
+def test_days_with_slots_do_not_wait_for_batch(monkeypatch):
+    batch, _ = _setup(monkeypatch)
+    trip = _trip()
+    trip.insert(1, {"city": "Rome", "date": trip[0]["date"], "slots": [{"name": "Colosseum", "time": "3pm"}]})
+
+    days = app.iter_plan(trip)
+    assert [next(days)["city"], next(days)["city"]] == ["Atlantis", "Rome"]
+    assert not batch.timed_out
+
+    batch.release.set()
+    assert [d["city"] for d in days] == ["El Dorado", "Shangri-La"]
@@ -1,134 +1,378 @@
 import os
-import requests
+import asyncio
+import functools
+import datetime as dt
 from dotenv import load_dotenv
-from langchain_core.tools import tool
+from langchain_core.tools import StructuredTool
+
+import http_client
+import metrics
+from cache import geocode_cache, normalize_key, GEOCODE_NEGATIVE_TTL, weather_cache, air_cache
 
 # Load .env file
 load_dotenv(override=True)
 
 GOOGLE_KEY = os.getenv("GOOGLE_MAPS_API_KEY")
 
-@tool
-def places_text_search(place_name: str, city: str) -> dict:
+# Set to e.g. http://127.0.0.1:8765 to send all three APIs to stub_server.py
+GOOGLE_API_BASE_URL = os.getenv("GOOGLE_API_BASE_URL", "").rstrip("/")
+
+
+def _endpoint(default_host: str, path: str) -> str:
+    return (GOOGLE_API_BASE_URL or default_host) + path
+
+
+PLACES_URL = _endpoint("https://maps.googleapis.com", "/maps/api/place/textsearch/json")
+WEATHER_URL = _endpoint("https://weather.googleapis.com", "/v1/forecast/days:lookup")
+AIR_QUALITY_URL = _endpoint("https://airquality.googleapis.com", "/v1/forecast:lookup")
+
+
+def _dual_tool(func, coroutine) -> StructuredTool:
+    """
+    Tool with a sync implementation for .invoke() and a native async one for .ainvoke().
+    The sync function's docstring is the tool description the agent sees.
+    """
+    return StructuredTool.from_function(
+        func=func,
+        coroutine=coroutine,
+        name=func.__name__.lstrip("_"),
+    )
+
+
+def _unavailable_as_error(fn):
+    """
+    An open circuit breaker or a network failure becomes an {"error": ...} result,
+    so one unavailable API degrades its own slots/days instead of failing the plan.
+    """
+    if asyncio.iscoroutinefunction(fn):
+
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            try:
+                return await fn(*args, **kwargs)
+            except http_client.UNAVAILABLE_ERRORS as e:
+                return _unavailable(e)
+
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        try:
+            return fn(*args, **kwargs)
+        except http_client.UNAVAILABLE_ERRORS as e:
+            return _unavailable(e)
+
+    return wrapper
+
+
+def _unavailable(e: Exception) -> dict:
+    return {"error": f"API unavailable: {e}", "unavailable": True}
+
+
+# -------------------------
+# Places Text Search
+# -------------------------
+@metrics.instrument("places_text_search")
+@_unavailable_as_error
+def _places_text_search(place_name: str, city: str) -> dict:
     """
     Convert a place name into address and latitude/longitude using Google Places Text Search API.
     Includes debug info if something goes wrong.
+    Results (and "No results found") are cached on disk per (place_name, city).
     """
+    cache_key = normalize_key(place_name, city)
+    hit, cached = geocode_cache.get(cache_key)
+    if hit:
+        return cached
 
-    query = f"{place_name}, {city}"
+    query, params = _places_params(place_name, city)
+    response = http_client.get(PLACES_URL, params=params, api="places")
+    return _parse_places(response.json(), query, cache_key)
+
+
+@metrics.instrument("places_text_search")
+@_unavailable_as_error
+async def _aplaces_text_search(place_name: str, city: str) -> dict:
+    cache_key = normalize_key(place_name, city)
+    hit, cached = await geocode_cache.aget(cache_key)
+    if hit:
+        return cached
+
+    query, params = _places_params(place_name, city)
+    response = await http_client.aget(PLACES_URL, params=params, api="places")
+    # _parse_places writes the SQLite geocode cache
+    return await asyncio.to_thread(_parse_places, response.json(), query, cache_key)
 
-    url = "https://maps.googleapis.com/maps/api/place/textsearch/json"
+
+def _places_params(place_name: str, city: str):
+    query = f"{place_name}, {city}"
     params = {
         "query": query,
         "key": GOOGLE_KEY
     }
+    return query, params
 
-    response = requests.get(url, params=params, timeout=20)
-    data = response.json()
 
+def _parse_places(data: dict, query: str, cache_key: str) -> dict:
     # DEBUG: if Google returns no results or an error
     if not data.get("results"):
-        return {
+        result = {
             "error": "No results found",
             "status": data.get("status"),
             "error_message": data.get("error_message"),
             "query": query
         }
+        # Only a genuine "nothing matches" is cached; key/quota errors are retried
+        if data.get("status") == "ZERO_RESULTS":
+            geocode_cache.set(cache_key, result, ttl_seconds=GEOCODE_NEGATIVE_TTL)
+        return result
 
     top = data["results"][0]
     location = top["geometry"]["location"]
 
-    return {
+    result = {
         "name": top.get("name"),
         "address": top.get("formatted_address"),
         "lat": location["lat"],
         "lon": location["lng"]
     }
+    geocode_cache.set(cache_key, result)
+    return result
+
+
+places_text_search = _dual_tool(_places_text_search, _aplaces_text_search)
+
 
-@tool
-def get_weather(lat: float, lon: float, days: int = 2) -> dict:
+# -------------------------
+# Weather (forecast.days)
+# -------------------------
+@metrics.instrument("get_weather")
+@_unavailable_as_error
+def _get_weather(lat: float, lon: float, days: int = 2) -> dict:
     """
     Get daily weather forecast using Google Weather API (forecast.days).
     """
-    url = "https://weather.googleapis.com/v1/forecast/days:lookup"
-    params = {
+    key = weather_cache.key(lat, lon, days)
+    hit, cached = weather_cache.get(key)
+    if hit:
+        return cached
+
+    r = http_client.get(WEATHER_URL, params=_weather_params(lat, lon, days), api="weather")
+    result = _parse_weather(r)
+    if result.get("ok"):
+        weather_cache.set(key, result)
+    return result
+
+
+@metrics.instrument("get_weather")
+@_unavailable_as_error
+async def _aget_weather(lat: float, lon: float, days: int = 2) -> dict:
+    key = weather_cache.key(lat, lon, days)
+    hit, cached = weather_cache.get(key)
+    if hit:
+        return cached
+
+    r = await http_client.aget(WEATHER_URL, params=_weather_params(lat, lon, days), api="weather")
+    result = _parse_weather(r)
+    if result.get("ok"):
+        weather_cache.set(key, result)
+    return result
+
+
+def _weather_params(lat: float, lon: float, days: int) -> dict:
+    return {
         "key": GOOGLE_KEY,
         "location.latitude": lat,
         "location.longitude": lon,
         "days": days,
     }
 
-    r = requests.get(url, params=params, timeout=20)
+
+def _parse_weather(r) -> dict:
+    forecast_days, error = _read_forecast_days(r)
+    if error:
+        return error
+
+    # Return a small useful subset for your assignment
+    return _summarize_forecast_day(forecast_days[0])
+
+
+def _read_forecast_days(r):
+    """
+    Returns (forecastDays, None) or (None, error dict).
+    """
     content_type = r.headers.get("Content-Type", "")
 
     # If not JSON, return debug info
     if "application/json" not in content_type:
-        return {
+        return None, {
             "error": "Non-JSON response from Weather API",
             "http_status": r.status_code,
             "content_type": content_type,
             "text_preview": r.text[:300],
-            "url": r.url,
+            "url": str(r.url),
         }
 
     data = r.json()
 
     # Google-style error payload
     if "error" in data:
-        return {
+        return None, {
             "error": "Weather API returned error",
             "details": data["error"],
-            "url": r.url,
+            "url": str(r.url),
         }
 
-    # Return a small useful subset for your assignment
     forecast_days = data.get("forecastDays", [])
     if not forecast_days:
-        return {"error": "No forecastDays in response", "raw": data}
+        return None, {"error": "No forecastDays in response", "raw": data}
+
+    return forecast_days, None
 
-    today = forecast_days[0]
-    daytime = today.get("daytimeForecast", {}).get("weatherCondition", {}).get("description", {}).get("text")
-    nighttime = today.get("nighttimeForecast", {}).get("weatherCondition", {}).get("description", {}).get("text")
+
+def _summarize_forecast_day(day: dict) -> dict:
+    daytime = day.get("daytimeForecast", {}).get("weatherCondition", {}).get("description", {}).get("text")
+    nighttime = day.get("nighttimeForecast", {}).get("weatherCondition", {}).get("description", {}).get("text")
 
     # Temps may appear in different places depending on response; keep raw if unsure
     return {
         "ok": True,
         "today_day": daytime,
         "today_night": nighttime,
-        "raw_preview": str(today)[:800],
+        "raw_preview": str(day)[:800],
     }
 
-import os
-import requests
-import datetime as dt
-from langchain_core.tools import tool
 
-@tool
-def get_air_quality(lat: float, lon: float, hours: int = 24) -> dict:
+def _forecast_date(day: dict) -> str:
+    """
+    "YYYY-MM-DD" of one forecastDays entry (displayDate, else interval start).
+    """
+    d = day.get("displayDate") or {}
+    if d.get("year") and d.get("month") and d.get("day"):
+        return f"{d['year']:04d}-{d['month']:02d}-{d['day']:02d}"
+    return (day.get("interval", {}).get("startTime") or "")[:10]
+
+
+get_weather = _dual_tool(_get_weather, _aget_weather)
+
+
+# -------------------------
+# Multi-day forecast (one call per city, used by build_plan)
+# -------------------------
+@metrics.instrument("get_weather")
+@_unavailable_as_error
+def get_daily_forecast(lat: float, lon: float, days: int) -> dict:
+    """
+    Every forecastDays entry for the next `days` days (max 10), keyed by date:
+    {"ok": True, "days": {"YYYY-MM-DD": {...same fields as get_weather...}}}
+    """
+    days = max(1, min(days, 10))
+    key = weather_cache.key(lat, lon, "by_date", days)
+    hit, cached = weather_cache.get(key)
+    if hit:
+        return cached
+
+    r = http_client.get(WEATHER_URL, params=_weather_params(lat, lon, days), api="weather")
+    result = _parse_daily_forecast(r)
+    if result.get("ok"):
+        weather_cache.set(key, result)
+    return result
+
+
+@metrics.instrument("get_weather")
+@_unavailable_as_error
+async def aget_daily_forecast(lat: float, lon: float, days: int) -> dict:
+    days = max(1, min(days, 10))
+    key = weather_cache.key(lat, lon, "by_date", days)
+    hit, cached = weather_cache.get(key)
+    if hit:
+        return cached
+
+    r = await http_client.aget(WEATHER_URL, params=_weather_params(lat, lon, days), api="weather")
+    result = _parse_daily_forecast(r)
+    if result.get("ok"):
+        weather_cache.set(key, result)
+    return result
+
+
+def _parse_daily_forecast(r) -> dict:
+    forecast_days, error = _read_forecast_days(r)
+    if error:
+        return error
+
+    return {
+        "ok": True,
+        "days": {_forecast_date(day): _summarize_forecast_day(day) for day in forecast_days},
+    }
+
+
+# -------------------------
+# Air Quality (forecast:lookup)
+# -------------------------
+@metrics.instrument("get_air_quality")
+@_unavailable_as_error
+def _get_air_quality(lat: float, lon: float, hours: int = 24) -> dict:
     """
     Get air quality hourly forecast using Google Air Quality API.
     Returns AQI category + whether to wear a mask.
     """
+    hours = _clamp_hours(hours)
+
+    key = air_cache.key(lat, lon, hours)
+    hit, cached = air_cache.get(key)
+    if hit:
+        return cached
+
+    params, body = _air_quality_request(lat, lon, hours)
+    r = http_client.post(AIR_QUALITY_URL, params=params, json=body, api="air_quality")
+    result = _parse_air_quality(r, hours)
+    if result.get("ok"):
+        air_cache.set(key, result)
+    return result
+
+
+@metrics.instrument("get_air_quality")
+@_unavailable_as_error
+async def _aget_air_quality(lat: float, lon: float, hours: int = 24) -> dict:
+    hours = _clamp_hours(hours)
+
+    key = air_cache.key(lat, lon, hours)
+    hit, cached = air_cache.get(key)
+    if hit:
+        return cached
+
+    params, body = _air_quality_request(lat, lon, hours)
+    r = await http_client.apost(AIR_QUALITY_URL, params=params, json=body, api="air_quality")
+    result = _parse_air_quality(r, hours)
+    if result.get("ok"):
+        air_cache.set(key, result)
+    return result
+
+
+def _clamp_hours(hours: int) -> int:
     if hours < 1:
         hours = 1
     if hours > 96:
         hours = 96
+    return hours
+
 
+def _air_quality_request(lat: float, lon: float, hours: int):
     # Align to next full hour
     now = dt.datetime.utcnow().replace(minute=0, second=0, microsecond=0)
     start_dt = now + dt.timedelta(hours=1)
     end_dt = start_dt + dt.timedelta(hours=hours)
 
-    url = "https://airquality.googleapis.com/v1/forecast:lookup"
     params = {"key": os.getenv("GOOGLE_MAPS_API_KEY")}
     body = {
         "location": {"latitude": lat, "longitude": lon},
         "period": {"startTime": start_dt.isoformat() + "Z", "endTime": end_dt.isoformat() + "Z"},
         "languageCode": "en",
     }
+    return params, body
 
-    r = requests.post(url, params=params, json=body, timeout=20)
 
+def _parse_air_quality(r, hours: int) -> dict:
     if "application/json" not in (r.headers.get("Content-Type") or ""):
         return {
             "error": "Non-JSON response from Air Quality API",
@@ -146,28 +390,48 @@ def get_air_quality(lat: float, lon: float, hours: int = 24) -> dict:
         return {"error": "No hourlyForecasts returned", "raw_preview": str(data)[:600]}
 
     first = hourly[0]
-    indexes = first.get("indexes", [])
-
-    aqi = None
-    category = None
-    for idx in indexes:
-        if idx.get("code") in ("uaqi", "us_aqi", "aqi"):
-            aqi = idx.get("aqi")
-            category = idx.get("category")
-            break
-
-    # Mask logic (simple)
-    mask_needed = False
-    if isinstance(aqi, (int, float)) and aqi >= 100:
-        mask_needed = True
-    if isinstance(category, str) and "unhealthy" in category.lower():
-        mask_needed = True
+    aqi, category = _hour_index(first)
 
     return {
         "ok": True,
         "first_hour": first.get("dateTime"),
         "aqi": aqi,
         "category": category,
-        "mask_needed": mask_needed,
+        "mask_needed": _mask_needed(aqi, category),
         "window_hours": hours,
+        "hourly": _hourly_series(hourly),
     }
+
+
+def _hour_index(hour: dict):
+    for idx in hour.get("indexes", []):
+        if idx.get("code") in ("uaqi", "us_aqi", "aqi"):
+            return idx.get("aqi"), idx.get("category")
+    return None, None
+
+
+def _mask_needed(aqi, category) -> bool:
+    # Mask logic (simple)
+    if isinstance(aqi, (int, float)) and aqi >= 100:
+        return True
+    if isinstance(category, str) and "unhealthy" in category.lower():
+        return True
+    return False
+
+
+def _hourly_series(hourly: list) -> dict:
+    """
+    The whole forecast as compact parallel lists, one entry per hour from "start":
+    {"start": ISO time, "aqi": [int | None, ...], "mask": [0 | 1, ...]}.
+    Used by build_plan to give every time slot its own AQI (see air_slots.py).
+    """
+    aqi_values = []
+    mask_flags = []
+    for hour in hourly:
+        aqi, category = _hour_index(hour)
+        aqi_values.append(aqi if isinstance(aqi, (int, float)) else None)
+        mask_flags.append(1 if _mask_needed(aqi, category) else 0)
+    return {"start": hourly[0].get("dateTime"), "aqi": aqi_values, "mask": mask_flags}
+
+
+get_air_quality = _dual_tool(_get_air_quality, _aget_air_quality)
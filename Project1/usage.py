@@ -0,0 +1,188 @@
+import os
+import time
+import threading
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+import metrics
+from cache import SqliteCache, PLAN_STORE_MAX_ENTRIES
+from checkpoint_store import IDLE_TTL
+
+# USD per 1M tokens (gpt-4o-mini list price); set these for another model
+LLM_INPUT_PRICE_PER_M = float(os.getenv("LLM_INPUT_PRICE_PER_M", "0.15"))
+LLM_OUTPUT_PRICE_PER_M = float(os.getenv("LLM_OUTPUT_PRICE_PER_M", "0.60"))
+# Latest runs kept per thread_id (with their itinerary shape)
+THREAD_USAGE_RUNS = int(os.getenv("THREAD_USAGE_RUNS", "20"))
+# Per-thread totals live as long as the thread's checkpoints (CHECKPOINT_IDLE_TTL;
+# when that is 0, i.e. never evicted, keep them for a year)
+THREAD_USAGE_TTL = float(os.getenv("THREAD_USAGE_TTL", str(IDLE_TTL or 365 * 24 * 3600)))
+
+# Call-site prefix of single chat-model API calls (see ModelUsageCallback)
+MODEL_PREFIX = "model."
+
+
+# -------------------------
+# Model calls -> metrics
+# -------------------------
+class ModelUsageCallback(BaseCallbackHandler):
+    """
+    Attached to a chat model: records every model API call's latency, output
+    size and prompt / completion tokens (AIMessage.usage_metadata) as call
+    "model.<site>", so they land in the current run's timings and the registry.
+    """
+
+    # Called on the model's own thread / event loop, so the current run timer is visible
+    run_inline = True
+
+    def __init__(self, site: str):
+        super().__init__()
+        self.name = MODEL_PREFIX + site
+        self._started: Dict[UUID, float] = {}
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            self._started[run_id] = time.perf_counter()
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            self._started[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        input_tokens, output_tokens = _token_usage(response)
+        nbytes = sum(len(g.text or "") for gens in response.generations for g in gens)
+        metrics.record(
+            self.name, self._elapsed(run_id), nbytes=nbytes,
+            input_tokens=input_tokens, output_tokens=output_tokens,
+        )
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        metrics.record(self.name, self._elapsed(run_id), error=True)
+
+    def _elapsed(self, run_id: UUID) -> float:
+        with self._lock:
+            started = self._started.pop(run_id, None)
+        return time.perf_counter() - started if started is not None else 0.0
+
+
+def _token_usage(response: LLMResult):
+    input_tokens = output_tokens = 0
+    for gens in response.generations:
+        for g in gens:
+            usage = getattr(getattr(g, "message", None), "usage_metadata", None)
+            if usage:
+                input_tokens += usage.get("input_tokens", 0)
+                output_tokens += usage.get("output_tokens", 0)
+    if not (input_tokens or output_tokens):
+        # Older integrations only report OpenAI-style token_usage
+        token_usage = (response.llm_output or {}).get("token_usage") or {}
+        input_tokens = token_usage.get("prompt_tokens", 0)
+        output_tokens = token_usage.get("completion_tokens", 0)
+    return input_tokens, output_tokens
+
+
+def cost_usd(input_tokens: int, output_tokens: int) -> float:
+    return round(
+        (input_tokens * LLM_INPUT_PRICE_PER_M + output_tokens * LLM_OUTPUT_PRICE_PER_M) / 1_000_000, 6
+    )
+
+
+# -------------------------
+# Per-run usage
+# -------------------------
+def trip_shape(trip: List[Dict[str, Any]]) -> Dict[str, int]:
+    """
+    What makes an itinerary expensive: days, distinct cities, slots, auto-generated days.
+    """
+    return {
+        "days": len(trip),
+        "cities": len({day["city"].casefold() for day in trip}),
+        "slots": sum(len(day.get("slots") or []) for day in trip),
+        "generated_days": sum(1 for day in trip if day.get("generated")),
+    }
+
+
+def run_usage(timings: Dict[str, Any], trip: List[Dict[str, Any]], plan_cache_hit: bool) -> Dict[str, Any]:
+    """
+    One planning run from its RunTimings summary: model calls / tokens / latency /
+    estimated cost, Google API requests, and the itinerary shape.
+    """
+    models = {name: c for name, c in timings["calls"].items() if name.startswith(MODEL_PREFIX)}
+    input_tokens = sum(c.get("input_tokens", 0) for c in models.values())
+    output_tokens = sum(c.get("output_tokens", 0) for c in models.values())
+
+    return {
+        "shape": trip_shape(trip),
+        "plan_cache_hit": plan_cache_hit,
+        "wall_seconds": timings["wall_seconds"],
+        "llm": {
+            "calls": sum(c["calls"] for c in models.values()),
+            "errors": sum(c["errors"] for c in models.values()),
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "seconds": round(sum(c["seconds"] for c in models.values()), 4),
+            "cost_usd": cost_usd(input_tokens, output_tokens),
+            "by_call": models,
+        },
+        "api_requests": timings["api_requests"],
+        "api_requests_total": sum(timings["api_requests"].values()),
+        "calls": timings["calls"],
+    }
+
+
+# -------------------------
+# Per-thread totals
+# -------------------------
+thread_usage_store = SqliteCache("thread_usage", THREAD_USAGE_TTL, PLAN_STORE_MAX_ENTRIES)
+_thread_lock = threading.Lock()
+
+
+def _empty_totals() -> Dict[str, Any]:
+    return {
+        "runs": 0,
+        "plan_cache_hits": 0,
+        "wall_seconds": 0.0,
+        "llm": {"calls": 0, "input_tokens": 0, "output_tokens": 0, "seconds": 0.0, "cost_usd": 0.0},
+        "api_requests": {},
+        "recent": [],
+    }
+
+
+def add_thread_usage(thread_id: str, usage: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Add one run to the thread's totals (kept THREAD_USAGE_TTL after the last run) and return them.
+    """
+    with _thread_lock:
+        hit, totals = thread_usage_store.get(thread_id)
+        if not hit:
+            totals = _empty_totals()
+
+        totals["runs"] += 1
+        totals["plan_cache_hits"] += int(usage["plan_cache_hit"])
+        totals["wall_seconds"] = round(totals["wall_seconds"] + usage["wall_seconds"], 4)
+        llm = totals["llm"]
+        for key in ("calls", "input_tokens", "output_tokens"):
+            llm[key] += usage["llm"][key]
+        llm["seconds"] = round(llm["seconds"] + usage["llm"]["seconds"], 4)
+        llm["cost_usd"] = cost_usd(llm["input_tokens"], llm["output_tokens"])
+        for api, n in usage["api_requests"].items():
+            totals["api_requests"][api] = totals["api_requests"].get(api, 0) + n
+
+        totals["recent"] = (totals["recent"] + [{
+            "shape": usage["shape"],
+            "wall_seconds": usage["wall_seconds"],
+            "input_tokens": usage["llm"]["input_tokens"],
+            "output_tokens": usage["llm"]["output_tokens"],
+            "api_requests": usage["api_requests_total"],
+        }])[-THREAD_USAGE_RUNS:]
+
+        thread_usage_store.set(thread_id, totals)
+        return totals
+
+
+def thread_usage(thread_id: str) -> Optional[Dict[str, Any]]:
+    hit, totals = thread_usage_store.get(thread_id)
+    return totals if hit else None